@@ -1,19 +1,1468 @@
 import os.path                      # libraries for pathnames
 import cv2                          # libraries for camera and processing
 from PyQt4 import QtGui, QtCore     # libraries for GUI implementation
+import sip                          # pointers to NumPy buffers for QImage
 import sys                          # system specific functions
-from PIL import Image               # for opening images
+import threading                    # background frame grabber
+import time                         # frame timestamps
+import collections                  # ring buffer of frames
+import queue                        # bounded queue for the image writer
+import itertools                    # parameter combinations for sweeps
+import multiprocessing              # process pool for parameter sweeps
+import struct                       # binary descriptor store
+import concurrent.futures           # background descriptor indexing
+import argparse                     # command line interface
+import glob                         # batch input patterns
+import re                           # image index from file names
+import sqlite3                      # capture catalog
+import json                         # frame spool headers and stats export
+import bisect                       # latency histogram buckets
+import csv                          # stats export
+import signal                       # pool workers leave Ctrl+C to the main process
 
 # libraries for image processing
-import matplotlib
 import numpy as np
-import matplotlib.pyplot as plt
+
+class NullTimer():
+    """Context manager doing nothing, returned by a disabled Stats."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class StageTimer():
+    """Context manager adding the time spent in a 'with' block to a Stats stage."""
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.record(self.name, time.perf_counter() - self.start)
+        return False
+
+class Stats():
+    """Latency histograms per processing stage, counters and gauges of a session.
+
+    Time a stage with 'with stats.stage("blur"): ...'. Latencies are counted
+    in fixed buckets (BUCKETS, upper bounds in ms) 10% apart, from which
+    percentiles are estimated to within 10%. Gauges are functions read when a snapshot is taken (queue
+    depths, FPS). When disabled, 'stage' returns a shared no-op context and
+    'record'/'count' return at once.
+    """
+    BUCKETS = [round(0.01 * 1.1 ** i, 6) for i in range(146)] + [float("inf")]   # 0.01 ms to 10 s
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stages = collections.OrderedDict()             # name -> [count, total, min, max, buckets]
+        self.counters = collections.OrderedDict()           # name -> value
+        self.gauges = collections.OrderedDict()             # name -> function returning a number
+        self.start_time = time.time()
+
+    def stage(self, name):
+        return StageTimer(self, name) if self.enabled else NULL_TIMER
+
+    def record(self, name, seconds):                        # add one latency to a stage
+        if not self.enabled:
+            return
+        ms = seconds * 1000
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = [0, 0.0, ms, ms, [0] * len(self.BUCKETS)]
+            stage[0] += 1
+            stage[1] += ms
+            stage[2] = min(stage[2], ms)
+            stage[3] = max(stage[3], ms)
+            stage[4][bisect.bisect_left(self.BUCKETS, ms)] += 1
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, function):                        # e.g. queue depth
+        self.gauges[name] = function
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.start_time = time.time()
+
+    def percentile(self, stage, p):                         # estimated from the histogram, in ms
+        count, total, low, high, buckets = stage
+        rank = p / 100.0 * count
+        seen = 0
+        for bound, n in zip(self.BUCKETS, buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(bound, high)
+        return high
+
+    def snapshot(self):
+        """Current statistics as a dict of 'stages', 'counters' and 'gauges'."""
+        with self.lock:
+            stages = [(name, [s[0], s[1], s[2], s[3], list(s[4])]) for name, s in self.stages.items()]
+            counters = dict(self.counters)
+        result = {"seconds": time.time() - self.start_time, "stages": collections.OrderedDict(),
+                  "counters": counters, "gauges": collections.OrderedDict()}
+        for name, stage in stages:
+            result["stages"][name] = {
+                "count": stage[0], "mean_ms": stage[1] / stage[0], "min_ms": stage[2], "max_ms": stage[3],
+                "p50_ms": self.percentile(stage, 50), "p90_ms": self.percentile(stage, 90),
+                "p99_ms": self.percentile(stage, 99),
+                "buckets": {str(b): n for b, n in zip(self.BUCKETS, stage[4]) if n}}
+        for name, function in list(self.gauges.items()):
+            try:
+                result["gauges"][name] = function()
+            except Exception:                               # e.g. component already closed
+                result["gauges"][name] = None
+        return result
+
+    def report(self):                                       # text for the stats panel
+        snap = self.snapshot()
+        lines = ["{:<15}{:>5}{:>8}{:>8}{:>8}".format("stage (ms)", "n", "mean", "p50", "p99")]
+        for name, stage in snap["stages"].items():
+            lines.append("{:<15}{:>5}{:>8.2f}{:>8.2f}{:>8.2f}".format(
+                name[:15], stage["count"], stage["mean_ms"], stage["p50_ms"], stage["p99_ms"]))
+        for name, value in list(snap["counters"].items()) + list(snap["gauges"].items()):
+            value = "-" if value is None else ("{:.1f}".format(value) if isinstance(value, float) else value)
+            lines.append("{:<28}{:>16}".format(name, value))
+        return "\n".join(lines)
+
+    def exportJson(self, file_name):
+        with open(file_name, "w") as out:
+            json.dump(self.snapshot(), out, indent=2)
+
+    def exportCsv(self, file_name):                         # one row per stage, counter and gauge
+        snap = self.snapshot()
+        with open(file_name, "w") as out:
+            rows = csv.writer(out)
+            rows.writerow(["kind", "name", "count", "mean_ms", "min_ms", "max_ms", "p50_ms", "p90_ms",
+                           "p99_ms", "value"])
+            for name, stage in snap["stages"].items():
+                rows.writerow(["stage", name] + [stage[k] for k in ("count", "mean_ms", "min_ms", "max_ms",
+                                                                    "p50_ms", "p90_ms", "p99_ms")] + [""])
+            for kind in ("counters", "gauges"):
+                for name, value in snap[kind].items():
+                    rows.writerow([kind[:-1], name] + [""] * 7 + [value])
+
+NO_STATS = Stats()                  # shared disabled Stats for components created without one
+
+class CameraSource():
+    """Frame source reading from a camera device through cv2.VideoCapture."""
+    def __init__(self, device=0):
+        self.device = device                                # device index (or file name)
+        self.c = None
+
+    def open(self):
+        self.c = cv2.VideoCapture(self.device)              # open capture device
+        return self.c.isOpened()
+
+    def read(self):
+        return self.c.read()                                # (ret, frame)
+
+    def release(self):
+        if self.c is not None:                              # if device was opened
+            self.c.release()                                # release it
+            self.c = None
+
+class VideoFileSource(CameraSource):
+    """Frame source playing back a video file, optionally looped and paced."""
+    def __init__(self, file_name, loop=True, realtime=True):
+        super(VideoFileSource, self).__init__(file_name)
+        self.loop = loop                                    # rewind at end of file
+        self.realtime = realtime                            # pace frames at the file's fps
+        self.frame_period = 0
+        self.next_time = 0
+
+    def open(self):
+        opened = super(VideoFileSource, self).open()
+        fps = self.c.get(cv2.CAP_PROP_FPS) if opened else 0
+        self.frame_period = 1.0 / fps if fps > 0 else 0     # seconds between frames
+        self.next_time = time.time()
+        return opened
+
+    def read(self):
+        if self.realtime and self.frame_period:             # wait until the frame is due
+            delay = self.next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + self.frame_period, time.time() - self.frame_period)
+        ret, frame = self.c.read()
+        if not ret and self.loop:                           # end of file: rewind and retry
+            self.c.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.c.read()
+        return ret, frame
+
+class SyntheticSource():
+    """Frame source generating a moving test pattern, for use without a camera."""
+    def __init__(self, width=640, height=480, fps=30):
+        self.device = "synthetic"                           # recorded in the catalog
+        self.width = width
+        self.height = height
+        self.fps = fps                                      # 0 generates frames as fast as possible
+        self.frame_number = 0
+        self.next_time = 0
+        self.background = None
+
+    def open(self):
+        # horizontal gradient with a fixed grid of squares as a static background
+        ramp = np.linspace(0, 255, self.width).astype(np.uint8)
+        self.background = np.dstack([np.tile(ramp, (self.height, 1))] * 3)
+        step = max(self.height // 6, 1)
+        for y in range(step // 2, self.height - step, step):
+            for x in range(step // 2, self.width - step, 2 * step):
+                cv2.rectangle(self.background, (x, y), (x + step // 2, y + step // 2), (40, 40, 40), -1)
+        self.next_time = time.time()
+        return True
+
+    def read(self):
+        if self.fps:                                        # pace frames at the requested fps
+            delay = self.next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + 1.0 / self.fps, time.time() - 1.0 / self.fps)
+        frame = self.background.copy()
+        n = self.frame_number
+        self.frame_number += 1
+        radius = max(self.height // 10, 1)
+        x = radius + (n * 4) % max(self.width - 2 * radius, 1)          # moving circle
+        cv2.circle(frame, (x, self.height // 2), radius, (255, 255, 255), -1)
+        return True, frame
+
+    def release(self):
+        self.background = None
+
+class FrameGrabber(threading.Thread):
+    """Background thread owning a frame source and filling a ring buffer.
+
+    The buffer holds the newest 'buffer_size' frames as (number, timestamp, frame)
+    tuples. Frames stored in the buffer are never modified afterwards. The
+    source is opened on the grabber thread, so a slow camera does not block
+    the caller; 'state' is "connecting" until then, and "connected" or
+    "failed" afterwards.
+    """
+    def __init__(self, source, buffer_size=4, stats=None):
+        super(FrameGrabber, self).__init__()
+        self.stats = stats or NO_STATS
+        self.daemon = True                                  # do not keep the process alive
+        self.source = source
+        self.frames = collections.deque(maxlen=buffer_size) # ring buffer of newest frames
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)     # notified on every new frame
+        self.frame_count = 0                                # frames grabbed so far
+        self.listeners = []                                 # called with every grabbed frame
+        self.running = False
+        self.state = "connecting"                           # "connected" or "failed" once opened
+
+    def start(self):
+        self.running = True                                 # before 'run', so 'stop' cannot be missed
+        super(FrameGrabber, self).start()
+
+    def run(self):
+        with self.stats.stage("open"):
+            opened = self.source.open()                     # open camera / video / generator
+        with self.lock:
+            self.state = "connected" if opened else "failed"
+            self.new_frame.notify_all()                     # wake 'waitForFrame' on failure
+        if not opened:
+            print("WARNING: Could not open {}.".format(self.source.device))
+            self.running = False
+        previous = None
+        while self.running:
+            ret, frame = self.source.read()                 # waits for the sensor or the frame rate
+            if not ret:                                     # no frame available right now
+                time.sleep(0.01)
+                continue
+            timestamp = time.time()
+            if previous is not None:                        # camera pacing, not the cost of a read
+                self.stats.record("frame interval", timestamp - previous)
+            previous = timestamp
+            with self.lock:
+                self.frame_count += 1
+                number = self.frame_count
+                self.frames.append((number, timestamp, frame))
+                self.new_frame.notify_all()
+                listeners = list(self.listeners)
+            for listener in listeners:                      # recorders: must return quickly
+                listener(number, timestamp, frame)
+        self.source.release()
+
+    def addListener(self, listener):
+        """Call 'listener(number, timestamp, frame)' on the grabber thread for every frame."""
+        with self.lock:
+            self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join(1.0)                                  # wait for the last read to finish
+        else:
+            self.source.release()
+
+    def fps(self, default=30):                              # frame rate measured over the ring buffer
+        with self.lock:
+            if len(self.frames) < 2 or self.frames[-1][1] <= self.frames[0][1]:
+                return default
+            return (len(self.frames) - 1) / (self.frames[-1][1] - self.frames[0][1])
+
+    def latestFrame(self, copy=True):
+        """Return (number, timestamp, frame) of the newest frame, or (0, None, None)."""
+        with self.lock:
+            if not self.frames:
+                return (0, None, None)
+            number, timestamp, frame = self.frames[-1]
+        return (number, timestamp, frame.copy() if copy else frame)
+
+    def waitForFrame(self, after=0, timeout=1.0, copy=True):
+        """Wait for a frame newer than number 'after' and return it like 'latestFrame'."""
+        with self.lock:
+            self.new_frame.wait_for(lambda: self.frame_count > after or self.state == "failed", timeout)
+        return self.latestFrame(copy)
+
+class LivePreview(threading.Thread):
+    """Background thread running edge detection on the newest grabbed frames.
+
+    Gaussian and Canny settings are read from 'settings' (a Capture) on
+    every frame. Frames that arrive while a frame is processed are skipped,
+    and at most 'target_fps' frames per second are processed. Frames are
+    downscaled by 'scale' before processing. The last result is available
+    from 'latestResult'.
+    """
+    def __init__(self, grabber, settings, target_fps=15, scale=1.0):
+        super(LivePreview, self).__init__()
+        self.daemon = True
+        self.grabber = grabber
+        self.settings = settings
+        self.target_fps = target_fps                        # 0: as fast as possible
+        self.scale = scale                                  # processing scale (1, 0.5, 0.25...)
+        self.median = IncrementalMedian(stride=2)           # automatic thresholds over recent frames
+        self.lock = threading.Lock()
+        self.result = None                                  # (number, edges, fps, latency)
+        self.fps = 0.0                                      # measured processing rate
+        self.latency = 0.0                                  # seconds from grab to edges
+        self.dropped = 0                                    # grabbed frames never processed
+        self.errors = 0                                     # frames skipped because processing failed
+        self.running = False
+
+    def run(self):
+        self.running = True
+        last_number = 0
+        last_time = None
+        last_error = None
+        while self.running:
+            start = time.time()
+            number, timestamp, frame = self.grabber.waitForFrame(last_number, 0.5, copy=False)
+            if self.grabber.state == "failed":              # no frame will ever come
+                print("WARNING: Live edges stopped: the camera could not be opened.")
+                break
+            if frame is None or number == last_number:      # no new frame yet
+                continue
+            if last_number:
+                self.dropped += number - last_number - 1    # frames skipped to keep up
+            last_number = number
+            try:
+                edges = self.process(frame)
+            except Exception as e:                          # e.g. settings OpenCV rejects: skip the frame
+                self.errors += 1
+                if str(e) != last_error:                    # report each new error once
+                    last_error = str(e)
+                    print("WARNING: Live edge detection failed: {}".format(last_error.strip()))
+                time.sleep(0.1)
+                continue
+            last_error = None
+            done = time.time()
+            self.latency = done - timestamp
+            if last_time is not None:                       # smoothed frames per second
+                rate = 1.0 / max(done - last_time, 1e-6)
+                self.fps = rate if not self.fps else 0.9 * self.fps + 0.1 * rate
+            last_time = done
+            with self.lock:
+                self.result = (number, edges, self.fps, self.latency)
+            if self.target_fps:                             # do not run faster than the target
+                delay = start + 1.0 / self.target_fps - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def process(self, frame):
+        settings = self.settings
+        stats = settings.stats
+        if self.scale != 1.0:                               # downscale before processing
+            with stats.stage("live scale"):
+                frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        with stats.stage("live gray"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        with stats.stage("live blur"):
+            blur = cv2.GaussianBlur(gray, settings.kernel_size, settings.std_Deviation)
+        if settings.manual_canny:
+            thr_1, thr_2 = settings.h_threshold1, settings.h_threshold2
+        else:
+            with stats.stage("live median"):
+                thr_1, thr_2 = autoThresholds(self.median.update(blur), settings.sigma)
+        with stats.stage("live canny"):
+            return cv2.Canny(blur, thr_1, thr_2)
+
+    def latestResult(self):                                 # (number, edges, fps, latency) or None
+        with self.lock:
+            return self.result
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join(1.0)
+
+class SpoolSource():
+    """Frame source reading a raw frame spool written by FrameSpool, memory-mapped."""
+    def __init__(self, file_name, loop=False):
+        self.device = file_name
+        self.loop = loop
+        self.frames = None
+        self.position = 0
+
+    def open(self):
+        self.frames = FrameSpool.load(self.device)
+        self.position = 0
+        return len(self.frames) > 0
+
+    def read(self):
+        if self.position >= len(self.frames):
+            if not self.loop or not len(self.frames):
+                return False, None
+            self.position = 0                               # rewind
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame
+
+    def release(self):
+        self.frames = None
+
+class ImageSequenceSource():
+    """Frame source reading a list of image files in order."""
+    def __init__(self, file_names):
+        self.device = os.path.dirname(file_names[0]) if file_names else ""
+        self.file_names = list(file_names)
+        self.position = 0
+
+    def open(self):
+        self.position = 0
+        return bool(self.file_names)
+
+    def read(self):
+        if self.position >= len(self.file_names):
+            return False, None
+        frame = readImage(self.file_names[self.position])
+        self.position += 1
+        return frame is not None, frame
+
+    def release(self):
+        pass
+
+def makeSource(spec):
+    """Frame source from a command line 'spec'.
+
+    A camera index ("0"), "synthetic" with an optional size and rate
+    ("synthetic:1280x720@15"), a raw frame spool or a video file, both
+    played back looped in real time like a camera.
+    """
+    if spec.isdigit():
+        return CameraSource(int(spec))
+    match = re.match(r"synthetic(?::(\d+)x(\d+))?(?:@(\d+))?$", spec)
+    if match:
+        width, height, fps = match.groups()
+        return SyntheticSource(int(width or 640), int(height or 480), int(fps or 30))
+    if spec.endswith(".raw"):
+        return SpoolSource(spec, loop=True)
+    return VideoFileSource(spec)
+
+class FrameSpool():
+    """Raw, memory-mappable file of consecutive frames of one shape.
+
+    Frames are appended unencoded to 'file_name'; their shape and type are
+    kept in 'file_name.json', written with the first frame, so a spool cut
+    short by a crash can still be read. Read it back with 'FrameSpool.load'.
+    """
+    def __init__(self, file_name, fps=0):
+        self.file_name = file_name
+        self.fps = fps
+        self.spool = None
+        self.shape = None
+        self.dtype = None
+        self.count = 0
+        self.timestamps = []
+
+    def write(self, frame, timestamp=None):
+        if self.spool is None:                              # first frame: header
+            self.shape, self.dtype = frame.shape, frame.dtype
+            self.writeHeader()
+            self.spool = open(self.file_name, "wb")
+        if frame.shape != self.shape:
+            raise ValueError("Frame shape changed from {} to {}".format(self.shape, frame.shape))
+        self.spool.write(np.ascontiguousarray(frame).tobytes())
+        self.count += 1
+        self.timestamps.append(timestamp)
+
+    def writeHeader(self):
+        with open(self.file_name + ".json", "w") as header:
+            json.dump({"shape": list(self.shape), "dtype": self.dtype.str, "fps": self.fps,
+                       "count": self.count, "timestamps": self.timestamps}, header)
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+            self.writeHeader()                              # final count and timestamps
+
+    @staticmethod
+    def load(file_name):
+        """Memory-map a spool as a (count, height, width[, channels]) array."""
+        with open(file_name + ".json") as header_file:
+            header = json.load(header_file)
+        shape, dtype = tuple(header["shape"]), np.dtype(header["dtype"])
+        frame_size = int(np.prod(shape)) * dtype.itemsize
+        count = os.path.getsize(file_name) // frame_size    # complete frames only
+        if count == 0:
+            return np.zeros((0,) + shape, dtype)
+        return np.memmap(file_name, dtype, "r", shape=(count,) + shape)
+
+class BurstRecorder():
+    """Records every grabbed frame into a preallocated buffer.
+
+    Recording stops after 'count' frames or 'duration' seconds, whichever
+    comes first; with only 'duration' the buffer holds 'duration' * 'fps'
+    frames. Frames are copied on the grabber thread, so nothing is encoded
+    while recording.
+    """
+    def __init__(self, grabber, count=None, duration=None, fps=30):
+        self.grabber = grabber
+        self.duration = duration
+        self.size = count or int(np.ceil(duration * fps)) + 1
+        self.buffer = None                                  # (size, height, width, channels)
+        self.timestamps = np.zeros(self.size)
+        self.count = 0                                      # frames recorded
+        self.start_time = None
+        self.done = threading.Event()
+
+    def start(self):
+        number, timestamp, frame = self.grabber.latestFrame(copy=False)
+        if frame is None:
+            number, timestamp, frame = self.grabber.waitForFrame(copy=False)
+        if frame is None:
+            raise RuntimeError("No frame available from the camera.")
+        self.buffer = np.empty((self.size,) + frame.shape, frame.dtype)    # preallocated
+        self.buffer[:] = 0                                  # touch pages before recording
+        self.grabber.addListener(self.onFrame)
+
+    def onFrame(self, number, timestamp, frame):            # Called on the grabber thread
+        if self.done.is_set():
+            return
+        if self.start_time is None:
+            self.start_time = timestamp
+        if self.duration is not None and timestamp - self.start_time > self.duration:
+            self.finish()
+            return
+        if frame.shape == self.buffer.shape[1:]:
+            self.buffer[self.count] = frame
+            self.timestamps[self.count] = timestamp
+            self.count += 1
+        if self.count == self.size:
+            self.finish()
+
+    def finish(self):
+        self.grabber.removeListener(self.onFrame)
+        self.done.set()
+
+    def wait(self, timeout=None):                           # True once recording has finished
+        return self.done.wait(timeout)
+
+    def frames(self):                                       # recorded frames
+        return self.buffer[:self.count]
+
+class VideoRecorder(threading.Thread):
+    """Records every grabbed frame to a video file or a raw FrameSpool.
+
+    Frames are queued on the grabber thread and written by this thread;
+    when more than 'max_pending' frames wait, new frames are dropped and
+    counted in 'dropped'. Files ending in '.raw' are written as a
+    FrameSpool, others with cv2.VideoWriter and codec 'fourcc'.
+    """
+    def __init__(self, grabber, file_name, fps=30, fourcc="MJPG", max_pending=64):
+        super(VideoRecorder, self).__init__()
+        self.daemon = True
+        self.grabber = grabber
+        self.file_name = file_name
+        self.fps = fps
+        self.fourcc = fourcc
+        self.queue = queue.Queue(max_pending)
+        self.count = 0                                      # frames written
+        self.dropped = 0                                    # frames lost because writing fell behind
+
+    def onFrame(self, number, timestamp, frame):            # Called on the grabber thread
+        try:
+            self.queue.put_nowait((timestamp, frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        writer = None
+        while True:
+            item = self.queue.get()
+            if item is None:                                # stop() was called
+                break
+            timestamp, frame = item
+            if writer is None:                              # open with the size of the first frame
+                writer = self.openWriter(frame)
+            if isinstance(writer, FrameSpool):
+                writer.write(frame, timestamp)
+            else:
+                writer.write(frame)
+            self.count += 1
+        if writer is not None:
+            writer.close() if isinstance(writer, FrameSpool) else writer.release()
+
+    def openWriter(self, frame):
+        if self.file_name.endswith(".raw"):
+            return FrameSpool(self.file_name, self.fps)
+        fourcc = cv2.VideoWriter_fourcc(*self.fourcc)
+        return cv2.VideoWriter(self.file_name, fourcc, self.fps, (frame.shape[1], frame.shape[0]),
+                               frame.ndim == 3)
+
+    def start(self):
+        super(VideoRecorder, self).start()
+        self.grabber.addListener(self.onFrame)
+
+    def stop(self):
+        self.grabber.removeListener(self.onFrame)
+        self.queue.put(None)                                # after the frames still queued
+        self.join()
+
+class MotionTrigger(threading.Thread):
+    """Background thread calling 'action' when grabbed frames change.
+
+    Frames are downscaled to 'width' pixels wide, converted to grayscale
+    and compared with a reference of the same size. 'action' is called
+    when the fraction of pixels differing by more than 'pixel_threshold'
+    reaches 'trigger_fraction', and at most once every 'cooldown' seconds.
+    Without a reference (see 'setReference') a running average of recent
+    frames, updated at 'learning_rate', is used instead.
+    """
+    def __init__(self, grabber, action, reference=None, width=160, pixel_threshold=25,
+                 trigger_fraction=0.02, cooldown=2.0, learning_rate=0.05, target_fps=30):
+        super(MotionTrigger, self).__init__()
+        self.daemon = True
+        self.grabber = grabber
+        self.action = action                                # called with the triggering fraction
+        self.width = width                                  # width of the compared frames
+        self.pixel_threshold = pixel_threshold              # gray level change counted as changed
+        self.trigger_fraction = trigger_fraction            # changed pixels that trigger 'action'
+        self.cooldown = cooldown                            # seconds between triggers
+        self.learning_rate = learning_rate                  # running background update rate
+        self.target_fps = target_fps                        # frames compared per second at most
+        self.lock = threading.Lock()
+        self.reference = None                               # fixed reference, downscaled
+        self.background = None                              # running background model (float32)
+        self.fraction = 0.0                                 # changed fraction of the last frame
+        self.triggers = 0                                   # number of times 'action' was called
+        self.last_trigger = 0
+        self.running = False
+        if reference is not None:
+            self.setReference(reference)
+
+    def downscale(self, frame):                             # small blurred grayscale frame
+        height = max(1, frame.shape[0] * self.width // frame.shape[1])
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)           # ignore sensor noise
+
+    def setReference(self, frame):                          # compare against 'frame' (None: running model)
+        with self.lock:
+            self.reference = self.downscale(frame) if frame is not None else None
+
+    def changedFraction(self, small):
+        with self.lock:
+            reference = self.reference
+        if reference is not None and reference.shape != small.shape:   # reference of another resolution
+            reference = cv2.resize(reference, (small.shape[1], small.shape[0]), interpolation=cv2.INTER_AREA)
+        if reference is None:                               # no fixed reference: running background
+            if self.background is None or self.background.shape != small.shape:
+                self.background = small.astype(np.float32)
+            reference = cv2.convertScaleAbs(self.background)
+            cv2.accumulateWeighted(small, self.background, self.learning_rate)
+        diff = cv2.absdiff(small, reference)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return float(changed) / diff.size
+
+    def run(self):
+        self.running = True
+        last_number = 0
+        while self.running:
+            start = time.time()
+            number, timestamp, frame = self.grabber.waitForFrame(last_number, 0.5, copy=False)
+            if self.grabber.state == "failed":              # no frame will ever come
+                print("WARNING: Motion trigger stopped: the camera could not be opened.")
+                break
+            if frame is None or number == last_number:      # no new frame yet
+                continue
+            last_number = number
+            self.fraction = self.changedFraction(self.downscale(frame))
+            if self.fraction >= self.trigger_fraction and time.time() - self.last_trigger >= self.cooldown:
+                self.last_trigger = time.time()
+                self.triggers += 1
+                try:
+                    self.action(self.fraction)
+                except Exception as e:
+                    print("WARNING: Motion trigger action failed: {}".format(e))
+            if self.target_fps:                             # do not run faster than the target
+                delay = start + 1.0 / self.target_fps - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join(1.0)
+
+class Encoding():
+    """File format used by ImageWriter for one kind of output.
+
+    'png' takes a compression 'level' (0-9), 'webp' and 'tiff' are written
+    lossless and 'raw' saves the array unencoded as a NumPy .npy file.
+    """
+    EXTENSIONS = {"png": ".png", "webp": ".webp", "tiff": ".tiff", "raw": ".npy"}
+
+    def __init__(self, fmt="png", level=1):
+        if fmt not in self.EXTENSIONS:
+            raise ValueError("Unknown image format: {}".format(fmt))
+        self.fmt = fmt
+        self.level = level                                  # PNG compression level
+
+    def fileName(self, name):                               # 'name' with this format's extension
+        return os.path.splitext(name)[0] + self.EXTENSIONS[self.fmt]
+
+    def params(self):                                       # cv2.imwrite parameters
+        if self.fmt == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.level]
+        if self.fmt == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, 101]          # quality above 100 is lossless
+        return []                                           # tiff: lossless LZW by default
+
+    def write(self, file_name, img, stats=NO_STATS):
+        # written under a temporary name and renamed, so an interrupted write leaves no partial image
+        part_name = file_name + ".part"
+        if self.fmt == "raw":
+            with stats.stage("disk write"):
+                with open(part_name, "wb") as out:
+                    np.save(out, img)                       # memory-mappable with np.load
+                os.replace(part_name, file_name)
+            return
+        with stats.stage("encode"):
+            ok, data = cv2.imencode(self.EXTENSIONS[self.fmt], img, self.params())
+        if not ok:
+            raise IOError("Could not encode {}".format(file_name))
+        with stats.stage("disk write"):
+            with open(part_name, "wb") as out:
+                out.write(data.tobytes())
+            os.replace(part_name, file_name)
+
+    def read(self, file_name, flags=cv2.IMREAD_COLOR):
+        return readImage(file_name, flags)
+
+def readImage(file_name, flags=cv2.IMREAD_COLOR):
+    """Read an image written in any 'Encoding', choosing the decoder by extension."""
+    if file_name.endswith(Encoding.EXTENSIONS["raw"]):
+        img = np.load(file_name)
+        if flags == cv2.IMREAD_GRAYSCALE and img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return img
+    return cv2.imread(file_name, flags)
+
+class ImageWriter():
+    """Writes images to disk from a pool of background threads.
+
+    At most 'max_pending' images wait in the queue; 'write' blocks when it is
+    full. With 'workers' set to 0 images are written synchronously. The
+    format of each kind of output ("capture", "reference", "blur", "canny")
+    is set in 'encodings'.
+    """
+    def __init__(self, workers=2, max_pending=16, stats=None):
+        self.stats = stats or NO_STATS
+        self.queue = queue.Queue(max_pending)               # bounded: applies backpressure
+        self.encodings = {}                                 # output kind -> Encoding
+        self.default_encoding = Encoding()
+        self.lock = threading.Lock()
+        self.in_progress = 0                                # queued or being written
+        self.errors = 0                                     # failed writes
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self.writeLoop)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def encoding(self, kind):
+        return self.encodings.get(kind, self.default_encoding)
+
+    def fileName(self, name, kind=None):                    # actual file name for an output
+        return self.encoding(kind).fileName(name)
+
+    def write(self, name, img, kind=None):
+        """Queue 'img' to be saved as 'name' and return the actual file name.
+
+        'img' must not be modified after it has been queued.
+        """
+        enc = self.encoding(kind)
+        file_name = enc.fileName(name)
+        if not self.threads:                                # synchronous mode
+            enc.write(file_name, img, self.stats)
+            return file_name
+        with self.lock:
+            self.in_progress += 1
+        self.queue.put((file_name, img, enc))               # blocks while the queue is full
+        return file_name
+
+    def writeLoop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:                                # close() was called
+                self.queue.task_done()
+                break
+            file_name, img, enc = item
+            try:
+                enc.write(file_name, img, self.stats)
+            except Exception as e:
+                self.errors += 1
+                print("WARNING: Could not write {}: {}".format(file_name, e))
+            finally:
+                with self.lock:
+                    self.in_progress -= 1
+                self.queue.task_done()
+
+    def pending(self):                                      # images not yet on disk
+        return self.in_progress
+
+    def read(self, name, kind=None, flags=cv2.IMREAD_COLOR):
+        """Read an output back, waiting for pending writes first."""
+        if self.in_progress:
+            self.flush()
+        enc = self.encoding(kind)
+        return enc.read(enc.fileName(name), flags)
+
+    def flush(self):                                        # wait until all queued images are written
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        for thread in self.threads:
+            self.queue.put(None)                            # one stop marker per thread
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+def autoThresholds(v, sigma):
+    """Canny thresholds from the image median 'v' (method by Adrian Rosebrock)."""
+    thr_1 = int(max(0, (1.0 - sigma) * v))                  # calculate Threshold 1
+    thr_2 = int(min(255, (1.0 + sigma) * v))                # calculate Threshold 2
+    return thr_1, thr_2
+
+def histogram(img):
+    """Histogram of an 8-bit single-channel image as 256 int64 counts."""
+    if img.size < 2 ** 24:                                  # counts are exact in calcHist's float32
+        return cv2.calcHist([img], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    return np.bincount(img.ravel(), minlength=256).astype(np.int64)
+
+def histogramMedian(hist):
+    """Median of the pixels counted in 'hist', equal to np.median of those pixels."""
+    cumulative = np.cumsum(hist)
+    n = int(cumulative[-1])
+    upper = int(np.searchsorted(cumulative, n // 2, side="right"))  # value of pixel n // 2 (sorted)
+    if n % 2:
+        return float(upper)
+    lower = int(np.searchsorted(cumulative, n // 2 - 1, side="right"))
+    return (lower + upper) / 2.0                            # even count: mean of the middle pair
+
+def imageMedian(img, stride=1):
+    """Median of an 8-bit single-channel image in O(N) through its histogram.
+
+    With 'stride' > 1 only every stride-th pixel of every stride-th row is
+    counted, which is faster but approximate.
+    """
+    if stride > 1:
+        img = img[::stride, ::stride]
+    return histogramMedian(histogram(img))
+
+class IncrementalMedian():
+    """Approximate median of a live stream of 8-bit single-channel frames.
+
+    Every frame is subsampled on a grid of 'stride' pixels, shifted by one
+    position per frame, and the histograms of the last 'window' frames are
+    summed. With the default window of stride ** 2 frames every pixel
+    position is counted once per window.
+    """
+    def __init__(self, stride=4, window=None):
+        self.stride = stride
+        self.window = window or stride ** 2
+        self.histograms = collections.deque()               # histograms of the frames in the window
+        self.total = np.zeros(256, np.int64)                # their sum
+        self.offset = 0                                     # grid position for the next frame
+
+    def update(self, img):                                  # add a frame and return the median
+        dy, dx = divmod(self.offset, self.stride)
+        self.offset = (self.offset + 1) % (self.stride ** 2)
+        hist = histogram(img[dy::self.stride, dx::self.stride])
+        self.histograms.append(hist)
+        self.total += hist
+        if len(self.histograms) > self.window:              # drop the oldest frame
+            self.total -= self.histograms.popleft()
+        return histogramMedian(self.total)
+
+    def reset(self):
+        self.histograms.clear()
+        self.total[:] = 0
+        self.offset = 0
+
+class BlurEntry():
+    """Blurred image held by BlurCache, with its median once calculated."""
+    def __init__(self, blur):
+        self.blur = blur
+        self.medians = {}                                   # median stride -> median, on first use
+        self.file_name = None                               # blurred image file, once written
+
+class BlurCache():
+    """Memory-bounded LRU cache of grayscale and blurred images.
+
+    Grayscale images are stored under (source,) and BlurEntry objects under
+    (source, kernel_size, std_deviation), where 'source' names the image
+    they were made from. The least recently used items are evicted once
+    'max_bytes' is exceeded.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes                          # memory budget
+        self.entries = collections.OrderedDict()            # key -> (value, size), oldest first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)                   # most recently used
+            return item[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            if size > self.max_bytes:                       # would evict everything else
+                return
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:              # evict least recently used
+                old_key, (old_value, old_size) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+
+    def invalidate(self, source):                           # drop everything made from 'source'
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == source]:
+                self.bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.entries), "bytes": self.bytes}
+
+class DescriptorIndex():
+    """ORB descriptors of saved images, searchable with FLANN LSH.
+
+    Descriptors are computed once per image and appended to 'file_name' as
+    binary records (name length, name, descriptor count, descriptors), so
+    the store survives restarts and a crash can at most lose the record
+    being written. A later record for the same name replaces earlier ones.
+    Images added after the LSH index was built are searched by brute force
+    until there are MERGE_SIZE of them, or an eighth of the library; the
+    LSH index is then rebuilt with every image on the background thread.
+    Loading the store and indexing a directory also run on that thread, so
+    queries never wait for them.
+    """
+    HEADER = struct.Struct("<HI")                           # name length, descriptor count
+    MERGE_SIZE = 32                                         # recent images that trigger a rebuild
+
+    def __init__(self, file_name, features=300):
+        self.file_name = file_name
+        self.orb = cv2.ORB_create(features)
+        self.names = []                                     # image name of each descriptor set
+        self.descriptors = []                               # (n, 32) uint8 array per image
+        self.ids = {}                                       # image name -> position in 'names'
+        self.matcher = None                                 # FLANN LSH index of the first images
+        self.recent = {}                                    # image id -> change number, not in 'matcher'
+        self.changes = 0
+        self.merging = None                                 # pending 'merge'
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)    # computes descriptors in the background
+        self.loading = self.executor.submit(self.load)      # reads the store without delaying startup
+
+    def load(self):
+        if not os.path.isfile(self.file_name):
+            return
+        with open(self.file_name, "rb") as store:
+            data = store.read()
+        position = 0
+        while position + self.HEADER.size <= len(data):
+            name_length, count = self.HEADER.unpack_from(data, position)
+            start = position + self.HEADER.size + name_length
+            end = start + count * 32
+            if end > len(data):                             # incomplete last record
+                break
+            name = data[position + self.HEADER.size:start].decode("utf-8")
+            with self.lock:                                 # queries may run meanwhile
+                self.store(name, np.frombuffer(data, np.uint8, count * 32, start).reshape(count, 32))
+            position = end
+        self.merge()                                        # index earlier sessions before any query
+
+    def store(self, name, descriptors):                     # keep descriptors in memory
+        if name in self.ids:                                # replaced image
+            self.descriptors[self.ids[name]] = descriptors
+        else:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.descriptors.append(descriptors)
+        self.changes += 1
+        self.recent[self.ids[name]] = self.changes
+
+    def compute(self, img):                                 # ORB descriptors of an image
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        keypoints, descriptors = self.orb.detectAndCompute(gray, None)
+        return descriptors if descriptors is not None else np.zeros((0, 32), np.uint8)
+
+    def add(self, name, img):
+        """Compute and persist the descriptors of image 'name'."""
+        self.append(name, img)
+        with self.lock:
+            if self.mergeDue() and self.merging is None:
+                self.merging = self.executor.submit(self.merge)
+
+    def addAsync(self, name, img):                          # 'add' on the background thread
+        return self.executor.submit(self.add, name, img)
+
+    def append(self, name, img):                            # compute, persist and keep descriptors
+        descriptors = self.compute(img)
+        encoded = name.encode("utf-8")
+        with self.lock:
+            with open(self.file_name, "ab") as store:
+                store.write(self.HEADER.pack(len(encoded), len(descriptors)) + encoded + descriptors.tobytes())
+            self.store(name, descriptors)
+
+    def mergeDue(self):                                     # enough recent images for a rebuild
+        return len(self.recent) >= max(self.MERGE_SIZE, len(self.names) // 8)
+
+    def addDirectory(self, directory, accept):
+        """Index the images of 'directory' whose names pass 'accept' and are not indexed yet.
+
+        Meant for the background thread ('addDirectoryAsync'), where the LSH
+        index is rebuilt between images instead of after all of them.
+        """
+        count = 0
+        for name in sorted(os.listdir(directory)):
+            if not accept(name) or name in self.ids:
+                continue
+            img = readImage(os.path.join(directory, name))
+            if img is None:
+                continue
+            self.append(name, img)
+            count += 1
+            if self.mergeDue():
+                self.merge()
+        return count
+
+    def addDirectoryAsync(self, directory, accept):         # 'addDirectory' on the background thread
+        return self.executor.submit(self.addDirectory, directory, accept)
+
+    def buildMatcher(self, descriptors):
+        matcher = cv2.FlannBasedMatcher(dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1),
+                                        dict(checks=50))    # algorithm 6: LSH, for binary descriptors
+        matcher.add([d if len(d) else np.zeros((1, 32), np.uint8) for d in descriptors])
+        matcher.train()
+        return matcher
+
+    def merge(self):
+        """Rebuild the LSH index with every image; queries use the old one meanwhile."""
+        with self.lock:
+            descriptors = list(self.descriptors)
+            recent = dict(self.recent)
+        matcher = self.buildMatcher(descriptors) if descriptors else None
+        with self.lock:
+            self.matcher = matcher                          # image ids are positions in 'descriptors'
+            for image_id, change in recent.items():
+                if self.recent.get(image_id) == change:     # not replaced while building
+                    del self.recent[image_id]
+            self.merging = None
+
+    def query(self, img, top=5, neighbours=5, max_distance=50):
+        """Rank indexed images by matches with 'img' and return the 'top' (name, matches).
+
+        Each descriptor of 'img' counts one match for every image among its
+        'neighbours' nearest descriptors closer than 'max_distance' bits, so
+        near-duplicate images in the library do not hide each other. The
+        nearest descriptors of the LSH index and of the recent images are
+        merged by distance.
+        """
+        descriptors = self.compute(img)
+        with self.lock:
+            if not self.names or not len(descriptors):
+                return []
+            names = list(self.names)
+            recent = sorted(self.recent)
+            matches = [[] for d in descriptors]
+            if self.matcher is not None:
+                for found, nearest in zip(matches, self.matcher.knnMatch(descriptors, k=neighbours)):
+                    found.extend((m.distance, m.imgIdx) for m in nearest if m.imgIdx not in self.recent)
+            if recent:                                      # brute force over images added since
+                matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+                matcher.add([self.descriptors[i] if len(self.descriptors[i]) else np.zeros((1, 32), np.uint8)
+                             for i in recent])
+                for found, nearest in zip(matches, matcher.knnMatch(descriptors, k=neighbours)):
+                    found.extend((m.distance, recent[m.imgIdx]) for m in nearest)
+        votes = np.zeros(len(names), np.int64)
+        for found in matches:
+            for image_id in set(i for distance, i in sorted(found)[:neighbours] if distance < max_distance):
+                votes[image_id] += 1
+        ranking = np.argsort(-votes)[:top]
+        return [(names[i], int(votes[i])) for i in ranking if votes[i] > 0]
+
+    def flush(self):                                        # wait until queued images are indexed
+        self.executor.submit(lambda: None).result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+class Catalog():
+    """Crash-safe SQLite catalog of captured images and their outputs.
+
+    Replaces the '.index' counter file: image indices are assigned inside
+    a transaction, so several processes can share the catalog. Captures
+    record their timestamp and device; outputs record the Gaussian and
+    Canny parameters they were made with. The database runs in WAL mode
+    with one connection per thread.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS captures (
+            path TEXT PRIMARY KEY, img_index, kind TEXT, device TEXT, timestamp REAL);
+        CREATE INDEX IF NOT EXISTS captures_by_index ON captures (img_index);
+        CREATE TABLE IF NOT EXISTS outputs (
+            path TEXT PRIMARY KEY, img_index, source TEXT, kind TEXT, kernel_size TEXT,
+            std_deviation REAL, sigma REAL, threshold_1 INTEGER, threshold_2 INTEGER,
+            aperture INTEGER, timestamp REAL);
+        CREATE INDEX IF NOT EXISTS outputs_by_index ON outputs (img_index, kind);
+        CREATE INDEX IF NOT EXISTS outputs_by_gauss ON outputs (kernel_size, std_deviation);
+        CREATE INDEX IF NOT EXISTS outputs_by_source ON outputs (source);
+    """
+
+    def __init__(self, file_name, legacy_index=None):
+        self.file_name = file_name
+        self.local = threading.local()                      # one connection per thread
+        db = self.connection()
+        db.executescript(self.SCHEMA)
+        start = 0
+        if legacy_index is not None and os.path.isfile(legacy_index):   # counter of older versions
+            with open(legacy_index) as index_file:
+                start = int(index_file.read() or 0)
+        with db:
+            db.execute("INSERT OR IGNORE INTO counters VALUES ('img_index', ?)", (start,))
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.file_name, timeout=30, isolation_level=None)  # explicit transactions
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")           # readers never block the writer
+            db.execute("PRAGMA synchronous=NORMAL")         # no fsync per commit in WAL mode
+            self.local.db = db
+        return db
+
+    def currentIndex(self):
+        return self.connection().execute("SELECT value FROM counters WHERE name = 'img_index'").fetchone()[0]
+
+    def nextIndex(self, name="img_index"):                  # atomically increment an index
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")                       # lock out other writers
+        try:
+            db.execute("INSERT OR IGNORE INTO counters VALUES (?, 0)", (name,))
+            db.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+            index = db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return index
+
+    def resetIndex(self):
+        self.connection().execute("UPDATE counters SET value = 0 WHERE name = 'img_index'")
+
+    def addCapture(self, path, img_index, kind="capture", device=None, timestamp=None):
+        """Record a captured image, forgetting the outputs of the image it overwrites."""
+        db = self.connection()
+        db.execute("BEGIN")
+        try:
+            db.execute("DELETE FROM outputs WHERE source = ?", (path,))
+            db.execute("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?)",
+                       (path, img_index, kind, None if device is None else str(device), timestamp or time.time()))
+            db.execute("COMMIT")
+        except Exception:                                   # e.g. database busy or full
+            db.execute("ROLLBACK")
+            raise
+
+    def addOutput(self, path, img_index, source, kind, kernel_size, std_deviation,
+                  sigma=None, threshold_1=None, threshold_2=None, aperture=None):
+        """Record an output image and the parameters it was made with."""
+        self.connection().execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  (path, img_index, source, kind, self.kernelText(kernel_size), std_deviation,
+                                   sigma if sigma != "" else None, threshold_1, threshold_2, aperture, time.time()))
+
+    def kernelText(self, kernel_size):                      # "(7,7)", as in file names
+        return kernel_size if isinstance(kernel_size, str) else str(tuple(kernel_size)).replace(" ", "")
+
+    def outputs(self, img_index=None, kind=None, kernel_size=None, std_deviation=None, source=None, **params):
+        """Outputs matching all given values, e.g. outputs(img_index=3, kind="canny")
+        or outputs(kernel_size=(7,7)). Other columns (sigma, threshold_1...) can be
+        given as keyword arguments."""
+        conditions = dict(params, img_index=img_index, kind=kind, std_deviation=std_deviation, source=source)
+        if kernel_size is not None:
+            conditions["kernel_size"] = self.kernelText(kernel_size)
+        conditions = [(column, value) for column, value in sorted(conditions.items()) if value is not None]
+        for column, value in conditions:
+            if not re.match(r"^\w+$", column):
+                raise ValueError("Unknown column: {}".format(column))
+        query = "SELECT * FROM outputs"
+        if conditions:
+            query += " WHERE " + " AND ".join("{} = ?".format(column) for column, value in conditions)
+        rows = self.connection().execute(query + " ORDER BY timestamp", [value for column, value in conditions])
+        return [dict(row) for row in rows]
+
+    def captures(self, img_index=None):
+        query, values = "SELECT * FROM captures", []
+        if img_index is not None:
+            query, values = query + " WHERE img_index = ?", [img_index]
+        return [dict(row) for row in self.connection().execute(query + " ORDER BY timestamp", values)]
+
+def processPool(processes=None, initializer=None, initargs=()):
+    """Process pool whose workers are started by a fork server (or spawned), not forked.
+
+    Forking a process with running threads (grabber, writer, Qt or OpenCV's
+    own) can copy locks they hold into the workers, which then hang.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method).Pool(processes, initializer, initargs)
+
+sweep_gray = None                   # grayscale image being swept, set in each worker process
+
+def sweepInit(gray):                                        # Process pool initializer for sweeps
+    global sweep_gray
+    sweep_gray = gray                                       # sent once per worker, not once per task
+    cv2.setNumThreads(1)                                    # parallelism comes from the pool
+
+def sweepBlur(task):
+    """Blur the swept image once and run every Canny combination on it.
+
+    'task' is (kernel_size, std_deviation, sigma, canny_params, file_pattern,
+    encoding, thumb_width); 'canny_params' lists (number, thr_1, thr_2,
+    aperture) with thresholds of None meaning automatic thresholds from
+    'sigma'. Returns a list of (number, thr_1, thr_2, file_name, thumbnail).
+    """
+    kernel_size, std_deviation, sigma, canny_params, file_pattern, encoding, thumb_width = task
+    blur = cv2.GaussianBlur(sweep_gray, kernel_size, std_deviation)
+    v = None
+    results = []
+    for number, thr_1, thr_2, aperture in canny_params:
+        if thr_1 is None:                                   # automatic thresholds
+            if v is None:
+                v = imageMedian(blur)                       # once per blurred image
+            thr_1, thr_2 = autoThresholds(v, sigma)
+        edges = cv2.Canny(blur, thr_1, thr_2, apertureSize=aperture)
+        file_name = None
+        if file_pattern:                                    # indexed set of files
+            file_name = encoding.fileName(file_pattern.format(number))
+            encoding.write(file_name, edges)
+        thumb = None
+        if thumb_width:                                     # tile for the contact sheet
+            height = max(1, edges.shape[0] * thumb_width // edges.shape[1])
+            thumb = cv2.resize(edges, (thumb_width, height), interpolation=cv2.INTER_AREA)
+        results.append((number, thr_1, thr_2, file_name, thumb))
+    return results
+
+class ParameterSweep():
+    """Runs Canny edge detection over combinations of parameters.
+
+    Each (kernel size, std deviation) pair is a task on a process pool: the
+    image is blurred once and every threshold/aperture combination is run
+    on that blurred image. When there are fewer blurs than processes, the
+    combinations of each blur are split into several tasks, and each of
+    those tasks blurs the image again. Thresholds left as None are
+    calculated from 'sigma' like 'Capture.getThresholds'. Threshold pairs
+    with thr_1 > thr_2 are skipped, since Canny swaps them. The pool is
+    started with 'forkserver' (or 'spawn'), not 'fork', since the GUI
+    process runs grabber, writer and Qt threads.
+    """
+    def __init__(self, kernel_sizes=(7,), std_deviations=(1,), thresholds_1=(None,),
+                 thresholds_2=(None,), apertures=(3,), sigma=.33, processes=None):
+        self.kernel_sizes = kernel_sizes
+        self.std_deviations = std_deviations
+        self.thresholds_1 = thresholds_1
+        self.thresholds_2 = thresholds_2
+        self.apertures = apertures
+        self.sigma = sigma
+        self.processes = processes                          # None: one per core
+        self.thumb_width = 160                              # contact sheet tile width
+        self.encoding = Encoding()                          # format of the edge images
+
+    def cannyParams(self):                                  # (thr_1, thr_2, aperture) combinations
+        params = []
+        for thr_1, thr_2, aperture in itertools.product(self.thresholds_1, self.thresholds_2, self.apertures):
+            if thr_1 is not None and thr_2 is not None and thr_1 > thr_2:
+                continue
+            params.append((thr_1, thr_2, aperture))
+        return params
+
+    def size(self):                                         # number of edge images produced
+        return len(self.kernel_sizes) * len(self.std_deviations) * len(self.cannyParams())
+
+    def run(self, img, out_dir, save_files=True, contact_sheet=True):
+        """Sweep 'img' and write the results to 'out_dir'.
+
+        Writes 'sweep_NNNN' files in 'encoding' listed in 'index.csv' and/or
+        a 'contact.png' sheet. Returns the rows of the index as
+        (number, kernel_size, std_deviation, sigma, thr_1, thr_2, aperture, file_name).
+        """
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        file_pattern = out_dir + "/sweep_{:04d}" if save_files else None
+        thumb_width = self.thumb_width if contact_sheet else 0
+        canny_params = self.cannyParams()
+
+        blurs = list(itertools.product(self.kernel_sizes, self.std_deviations))
+        processes = self.processes or multiprocessing.cpu_count()
+        splits = max(1, min(len(canny_params), processes // len(blurs)))    # tasks per blur
+        tasks = []
+        rows = {}
+        number = 0
+        for k, std in blurs:
+            numbered = []
+            for thr_1, thr_2, aperture in canny_params:
+                number += 1
+                numbered.append((number, thr_1, thr_2, aperture))
+                sigma = self.sigma if thr_1 is None else "" # sigma N/A for manual thresholds
+                rows[number] = [number, (k, k), std, sigma, thr_1, thr_2, aperture, None]
+            for i in range(splits):
+                tasks.append(((k, k), std, self.sigma, numbered[i::splits], file_pattern, self.encoding,
+                              thumb_width))
+
+        thumbs = {}
+        pool = processPool(processes, initializer=sweepInit, initargs=(gray,))
+        try:
+            for results in pool.imap_unordered(sweepBlur, tasks):
+                for number, thr_1, thr_2, file_name, thumb in results:
+                    rows[number][4:6] = [thr_1, thr_2]      # actual thresholds used
+                    rows[number][7] = file_name
+                    thumbs[number] = thumb
+        finally:
+            pool.close()
+            pool.join()
+
+        rows = [tuple(rows[n]) for n in sorted(rows)]
+        if save_files:
+            with open(out_dir + "/index.csv", "w") as index_file:
+                index_file.write("number,kernel_size,std_deviation,sigma,threshold_1,threshold_2,aperture,file\n")
+                for row in rows:
+                    index_file.write('{},"{}",{},{},{},{},{},{}\n'.format(
+                        row[0], str(row[1]).replace(" ", ""), row[2], row[3], row[4], row[5], row[6],
+                        os.path.basename(row[7])))
+        if contact_sheet:
+            Encoding("png").write(out_dir + "/contact.png", self.contactSheet(rows, thumbs))
+        return rows
+
+    def contactSheet(self, rows, thumbs):                   # grid of labelled thumbnails
+        columns = int(np.ceil(np.sqrt(len(rows))))
+        tile_h = max(t.shape[0] for t in thumbs.values()) + 14   # room for the label
+        tile_w = self.thumb_width
+        sheet_rows = (len(rows) + columns - 1) // columns
+        sheet = np.zeros((sheet_rows * tile_h, columns * tile_w), np.uint8)
+        for i, row in enumerate(rows):
+            thumb = thumbs[row[0]]
+            y, x = (i // columns) * tile_h, (i % columns) * tile_w
+            sheet[y + 14:y + 14 + thumb.shape[0], x:x + thumb.shape[1]] = thumb
+            label = "{} k{} s{} {}:{} a{}".format(row[0], row[1][0], row[2], row[4], row[5], row[6])
+            cv2.putText(sheet, label, (x + 2, y + 11), cv2.FONT_HERSHEY_PLAIN, 0.8, 255, 1)
+        return sheet
 
 class Capture():
-    def __init__(self):
+    # 'source' defaults to camera 0 and 'root' to ~/Pictures/CamView. A 'headless' Capture
+    # opens no frame source, writes synchronously and only runs the processing pipeline.
+    # With 'match_index' False, captured images are not indexed for 'matchImage'.
+    def __init__(self, source=None, root=None, headless=False, match_index=True):
 
         self.capturing = False
-        self.c = cv2.VideoCapture(0)
+        self.headless = headless
+        self.stats = Stats(enabled=not headless)            # per-stage timings of this session
+        self.source = None
+        self.grabber = None
+        if not headless:
+            self.source = source if source is not None else CameraSource(0)
+            self.grabber = FrameGrabber(self.source, stats=self.stats)  # opens the source and grabs frames
+            self.grabber.start()
+            self.stats.gauge("capture fps", lambda: self.grabber.fps(0.0))
+            self.stats.gauge("frames grabbed", lambda: self.grabber.frame_count)
+        self.display_timer = None                           # passes new frames to 'live_view'
+        self.display_interval = 15                          # ms between checks for a new frame
+        self.live_view = None                               # FrameView of the capture, set by the Window
+        self.result_view = None                             # FrameView of edges and matches
+        self.shown = None                                   # last frame passed to 'live_view'
+        self.writer = ImageWriter(0 if headless else 2, stats=self.stats)  # writes images in the background
+        self.stats.gauge("writer queue", self.writer.pending)
+        self.verbose = True                                 # print a message for every saved image
+        self.preview = None                                 # live edge detection, when enabled
+        self.live_edges = False                             # show edges instead of the camera image
+        self.live_fps = 15                                  # target rate of the live preview
+        self.live_scale = 1.0                               # processing scale of the live preview
+        self.motion = None                                  # motion trigger, when enabled
+        self.motion_fraction = 0.02                         # changed pixels that trigger a capture
+        self.motion_cooldown = 2.0                          # seconds between triggered captures
+        self.motion_edges = False                           # also detect edges on triggered captures
+        self.reference_frame = None                         # last background reference frame
+        self.stats.gauge("live fps", lambda: self.preview.fps if self.preview else 0.0)
+        self.stats.gauge("live dropped frames", lambda: self.preview.dropped if self.preview else 0)
+        self.stats.gauge("recording queue", lambda: self.recorder.queue.qsize() if self.recorder else 0)
+        self.stats.gauge("recording dropped", lambda: self.recorder.dropped if self.recorder else 0)
+        self.burst_frames = 30                              # frames per burst
+        self.burst_seconds = None                           # or seconds per burst (first limit wins)
+        self.burst_format = "images"                        # "images" (capture encoding) or "spool"
+        self.recorder = None                                # continuous recording, when enabled
+        self.record_format = "video"                        # "video" (MJPG .avi) or "spool" (.raw)
+        self.lock = threading.RLock()                       # serializes captures and processing
 
         self.kernel_size = (7,7)            # default value for Kernel Size
         self.std_Deviation = 1              # default value for Std Deviation
@@ -23,20 +1472,36 @@ class Capture():
 
         self.show_canny_image = True        # open canny image by default
         self.manual_canny = False           # calculate threshold values automatically by default
+        self.save_blurred = True            # write blurred images to disk (not needed by the pipeline)
+        self.last_picture = (None, None)    # name and frame of the last saved image, kept in memory
+        self.blur_cache = BlurCache()       # grayscale and blurred images by source and Gauss parameters
+        self.blur_entry = None              # cache entry of the last blurred image
+        self.blur_files = {}                # blurred image file -> cache key of the image written last
+        self.median_stride = 1              # subsample the median for automatic thresholds (1: exact)
 
-        home_dir = os.path.expanduser("~")                      # get home directory
+        if root is None:                                        # default location
+            root = os.path.expanduser("~") + "/Pictures/CamView"    # in the home directory
+        self.root = root
 
         # define all directory locations
-        a_dir = home_dir + "/Pictures/CamView/1-captured"       # index file and capture image directory
-        b_dir = home_dir + "/Pictures/CamView/2-blurred"        # blurred images directory
-        c_dir = home_dir + "/Pictures/CamView/3-processed"      # canny edge image directory
+        a_dir = root + "/1-captured"                            # index file and capture image directory
+        b_dir = root + "/2-blurred"                             # blurred images directory
+        c_dir = root + "/3-processed"                           # canny edge image directory
+        d_dir = root + "/4-swept"                               # parameter sweep directory
+        e_dir = root + "/5-recorded"                            # bursts and recordings directory
 
         # define all file names
-        self.index_dir = a_dir + "/.index"                      # index file
+        self.index_dir = a_dir + "/.index"                      # index file of older versions
+        self.catalog_dir = root + "/catalog.db"                 # catalog of captures and outputs
+        self.descriptor_dir = a_dir + "/.descriptors"           # ORB descriptors of captured images
         self.img_dir = a_dir + "/img_{}.png"                    # captured images from Cam
         self.blur_dir = b_dir + "/blur_{}_{}:{}.png"            # blurred images
         self.ref_dir = a_dir + "/REF.png"                       # background reference image
         self.canny_dir = c_dir + "/canny_{}_{}:{}-{}-{}:{}.png" # images processed by canny edge detection
+        self.sweep_dir = d_dir + "/img_{}_{}"                   # one folder per image and swept parameter
+        self.burst_dir = e_dir + "/burst_{}"                    # one folder (or spool) per burst
+        self.record_dir = e_dir + "/rec_{}"                     # recordings (.avi or .raw spool)
+        self.playback_dir = e_dir + "/{}_{:04d}.png"            # frame names of processed recordings
 
         # make sure a folder exists to save captured images
         if not os.path.exists(a_dir):                       # check if folder exists
@@ -56,73 +1521,140 @@ class Capture():
         else:                                               # else:
             pass                                            # do nothing
 
-        # make sure index file exists
-        if not os.path.isfile(self.index_dir):              # check if index file exists
-            self.index_file = open(self.index_dir, 'w')     # create file if it doesn't
-            self.index_file.write(str(0))                   # make index 0 by default
-            self.index_file.close()                         # close file (save changes)
-        else:                                               # else:
-            pass                                            # do nothing
+        self.catalog = Catalog(self.catalog_dir, self.index_dir)    # assigns image indices
+        self.img_index = self.catalog.currentIndex()        # determine 'img_index' from catalog
+        self.blur_source = None                             # image blurred last, for the catalog
+        self.frame_time = None                              # grab time of the last saved frame
 
-        self.index_file = open(self.index_dir)              # open index file in read mode
-        self.img_index = int(self.index_file.read())        # determine 'img_index' from file
-        self.index_file.close()                             # close file
+        self.descriptor_index = None                        # for 'matchImage'
+        self.library_indexing = None                        # indexing of earlier captures
+        if match_index and not headless:
+            self.descriptor_index = DescriptorIndex(self.descriptor_dir)
+            self.library_indexing = self.indexLibrary()
 
         # Starts image capturing. Called by the 'Start' button.
     def startCapture(self):
         print ("pressed Start")
+        if self.capturing:                                  # already showing frames
+            return
         self.capturing = True
-        cap = self.c
-        while(self.capturing):
-            ret, frame = cap.read()
-            cv2.imshow("Capture", frame)                    # show capture window
-            cv2.moveWindow("Capture", 1275, 0)              # move window to desired location
-            cv2.waitKey(5)
-        cv2.destroyAllWindows()
+        if self.display_timer is None:                      # refresh window from the Qt event loop
+            self.display_timer = QtCore.QTimer()
+            self.display_timer.timeout.connect(self.showFrame)
+        self.display_timer.start(self.display_interval)
+
+        # Shows the newest grabbed frame. Called by the display timer.
+    def showFrame(self):
+        if self.live_view is None:                          # no window to show frames in
+            return
+        text = None
+        if self.live_edges and self.preview is not None:    # live edge detection
+            result = self.preview.latestResult()
+            if result is None:                              # nothing processed yet
+                return
+            number, frame, fps, latency = result
+            text = "{:.1f} fps  {:.0f} ms  {} dropped".format(fps, latency * 1000, self.preview.dropped)
+            number = ("edges", number)
+        else:                                               # else: camera image
+            number, timestamp, frame = self.grabber.latestFrame(copy=False)
+        if frame is None or number == self.shown:           # nothing new grabbed
+            return
+        self.shown = number
+        self.live_view.setFrame(frame, text)                # painted at the next screen refresh
 
         # Stops image capturing. Called by the 'Stop' button.
     def endCapture(self):
         print ("pressed Stop")
         self.capturing = False
+        if self.display_timer is not None:
+            self.display_timer.stop()
+        if self.live_view is not None:
+            self.live_view.clear()
+        self.shown = None
 
     def quitCapture(self):
         print ("pressed Quit")
-        cap = self.c
-        cv2.destroyAllWindows()
-        cap.release()
+        self.endCapture()
+        self.close()
         QtCore.QCoreApplication.quit()
 
+        # Stops all background threads and releases the frame source. Called by 'quitCapture'
+        # and when the window is closed; calling it again does nothing more.
+    def close(self):
+        if self.display_timer is not None:
+            self.display_timer.stop()
+        if self.preview is not None:
+            self.preview.stop()                             # stops live edge detection
+            self.preview = None
+        if self.motion is not None:
+            self.motion.stop()                              # stops motion trigger
+            self.motion = None
+        if self.recorder is not None:
+            self.recorder.stop()                            # finishes the recording
+            print("Recorded {} frames to {}".format(self.recorder.count, self.recorder.file_name))
+            self.recorder = None
+        if self.grabber is not None:
+            self.grabber.stop()                             # stops grabbing and releases the source
+        pending = self.writer.pending()
+        if pending:                                         # images still waiting to be written
+            print("Writing {} pending images...".format(pending))
+        self.writer.close()                                 # flush and stop writer threads
+        if self.descriptor_index is not None:
+            self.descriptor_index.close()                   # finish indexing captured images
+
+        # "connecting", "connected" or "failed" for the camera; "headless" without one
+    def connectionState(self):
+        if self.grabber is None:
+            return "headless"
+        return self.grabber.state
+
+        # Copies the newest frame from the grabber. Called by 'savePicture' and 'saveBackground'.
+    def grabFrame(self):
+        number, timestamp, frame = self.grabber.latestFrame()
+        if frame is None:                                   # grabber has no frame yet
+            number, timestamp, frame = self.grabber.waitForFrame()
+        self.frame_time = timestamp                         # when the frame was grabbed
+        if frame is None:
+            print("WARNING: No frame available from the camera.")
+        return frame
+
         # Saves a captured image on specified folder. Called by 'takePicture'.
     def savePicture(self):
-        cap = self.c
-        ret, frame = cap.read()
-        self.img_index += 1                                 # updates index variable (+1)
+        frame = self.grabFrame()
+        if frame is None:
+            return
+        self.img_index = self.catalog.nextIndex()           # updates index (+1) in the catalog
         img_name = self.img_dir.format(self.img_index)      # sets name + index and directory of captured image
-        cv2.imwrite(img_name, frame)                        # saves image to directory
-        print("Saved Picture as {}".format(img_name))       # send message to terminal
-
-        # updates index file
-        self.index_file = open(self.index_dir, 'r+')        # open index file in read/write mode
-        self.index_file.seek(0)                             # move cursor to begining of file
-        self.index_file.write(str(self.img_index))          # updates index number in file (+1)
-        self.index_file.close()                             # close file (saves to file)
+        file_name = self.writer.write(img_name, frame, "capture")   # saves image to directory
+        self.catalog.addCapture(file_name, self.img_index, "capture", self.source.device, self.frame_time)
+        self.last_picture = (img_name, frame)               # keep frame for 'detectEdges'
+        self.blur_cache.invalidate(img_name)                # the index may have been reset
+        if self.descriptor_index is not None:
+            self.descriptor_index.addAsync(os.path.basename(file_name), frame) # index it for 'matchImage'
+        if self.verbose:
+            print("Saved Picture as {}".format(file_name))  # send message to terminal
 
     def saveBackground(self):
-        cap = self.c
-        ret, frame = cap.read()
+        frame = self.grabFrame()
+        if frame is None:
+            return
         bck_name = self.ref_dir
-        cv2.imwrite(bck_name, frame)                        # saves image to directory
-        print("Saved Picture as {}".format(bck_name))       # send message to terminal
+        file_name = self.writer.write(bck_name, frame, "reference") # saves image to directory
+        self.catalog.addCapture(file_name, None, "reference", self.source.device, self.frame_time)
+        self.last_picture = (bck_name, frame)               # keep frame for 'backgroundReference'
+        self.reference_frame = frame                        # compared against by the motion trigger
+        if self.motion is not None:
+            self.motion.setReference(frame)
+        self.blur_cache.invalidate(bck_name)                # drop blurs of the old reference
+        print("Saved Picture as {}".format(file_name))      # send message to terminal
+        return frame
 
         # Resets Image Index. Called by the 'Reset Index' button.
     def resetIndex(self):
-        self.index_file.close()                             # close index file (assumes it's already open)
-        self.index_file = open(self.index_dir, 'w')         # open index file in write mode
-        self.index_file.seek(0)                             # move cursor to begining of file
-        self.index_file.write(str(0))                       # write '0' on file
-        self.index_file.close()                             # close file (save changes)
-        self.index_file = open(self.index_dir, 'r+')        # re-opens file in read/write mode
-        self.img_index = 0                                  # resets index variable to 0
+        with self.lock:
+            self.catalog.resetIndex()                       # write '0' in the catalog
+            self.img_index = 0                              # resets index variable to 0
+            self.blur_cache.clear()                         # images will be overwritten
         print("WARNING: Image index reset!")                # warns about index being reset
 
     def cannyCheckBox(self):                                # Toogle value of show_canny_image
@@ -131,7 +1663,61 @@ class Capture():
     def autoCannyCheckBox(self):                            # Toogle value of manual_canny
         self.manual_canny = not self.manual_canny           # Called by the 'Manual Threshold' checkbox
 
+    def liveEdgesCheckBox(self):                            # Toggle live edge detection
+        self.live_edges = not self.live_edges               # Called by the 'Live Edges' checkbox
+        if self.live_edges:
+            self.preview = LivePreview(self.grabber, self, self.live_fps, self.live_scale)
+            self.preview.start()
+        elif self.preview is not None:
+            self.preview.stop()
+            self.preview = None
+
+    def motionCheckBox(self):                               # Toggle motion triggered captures
+        if self.motion is None:                             # Called by the 'Motion Trigger' checkbox
+            reference = self.reference_frame
+            if reference is None and os.path.exists(self.writer.fileName(self.ref_dir, "reference")):
+                reference = self.writer.read(self.ref_dir, "reference")    # saved background reference
+            self.motion = MotionTrigger(self.grabber, self.motionCapture, reference,
+                                        trigger_fraction=self.motion_fraction, cooldown=self.motion_cooldown)
+            self.motion.start()
+            print("Motion trigger on ({})".format("reference" if reference is not None else "running background"))
+        else:
+            self.motion.stop()
+            self.motion = None
+            print("Motion trigger off")
+
+    def motionFraction(self, val):                          # update value from motion % spinbox
+        self.motion_fraction = val / 100.0
+        if self.motion is not None:
+            self.motion.trigger_fraction = self.motion_fraction
+
+    def motionEdgesCheckBox(self):                          # Toggle value of motion_edges
+        self.motion_edges = not self.motion_edges           # Called by the 'Motion Edges' checkbox
+
+    def statsCheckBox(self):                                # Toggle timing collection
+        self.stats.enabled = not self.stats.enabled         # Called by the 'Collect Stats' checkbox
+        if self.stats.enabled:
+            self.stats.reset()                              # start a new measurement
+
+    def motionCapture(self, fraction):                      # Called by the motion trigger
+        print("Motion detected ({:.1f}% changed)".format(fraction * 100))
+        with self.lock:
+            self.savePicture()                              # take a picture
+            if self.motion_edges:
+                self.detectEdges()                          # and process it
+
+    def liveFps(self, val):                                 # update value from live FPS spinbox
+        self.live_fps = val
+        if self.preview is not None:
+            self.preview.target_fps = val                   # takes effect on the next frame
+
+    def liveScale(self, index):                             # update value from live scale combobox
+        self.live_scale = 1.0 / 2 ** index                  # 1, 1/2, 1/4
+        if self.preview is not None:
+            self.preview.scale = self.live_scale            # takes effect on the next frame
+
     def kernelSize(self, val):                              # update value from kernel size spinbox
+        val |= 1                                            # Gaussian kernel sizes must be odd
         self.kernel_size = (val,val)                        # pass value to Kernel size variable
 
     def stdDeviation(self, val):                            # update value from Standard Deviation spinbox
@@ -146,65 +1732,279 @@ class Capture():
     def hysteresisThreshold_2(self, val):                   # update value from hysteresisThreshold_2 spinbox
         self.h_threshold2 = val                             # pass value to Threshold 2 variable
 
-        # Canny Edge detection. Called by either 'backgroundReference' or 'detectEdges'
-    def cannyEdges(self, blur_name):
-        blur = cv2.imread(blur_name)                        # get blurred image
-        thr = self.getThresholds(blur_name)                 # get threshold values
+        # Canny Edge detection. Called by either 'backgroundReference' or 'detectEdges'.
+        # 'blur' is the single-channel blurred image; it is read from 'blur_name' if not given.
+    def cannyEdges(self, blur_name, blur=None):
+        if blur is None:                                    # no image in memory
+            blur = self.writer.read(blur_name, "blur", cv2.IMREAD_GRAYSCALE)    # get blurred image
+        thr = self.getThresholds(blur_name, blur)           # get threshold values
         gauss = self.getGaussParameters()                   # get Gauss filter parameters
         # name of canny edge image
         canny_name = self.canny_dir.format(self.img_index, gauss[0], gauss[1], thr[0], thr[1], thr[2])
-        edges = cv2.Canny(blur, thr[1], thr[2])             # Canny Edge detection
-        cv2.imwrite(canny_name, edges)                      # writes image on the directory
-        print("Canny Edge image saved as " + canny_name)    # send message to terminal
-        return(canny_name)
-
-    def blurImage(self, img_name):
-        img = cv2.imread(img_name)                          # read image
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)        # grayscale image
+        with self.stats.stage("canny"):
+            edges = cv2.Canny(blur, thr[1], thr[2])         # Canny Edge detection
+        canny_name = self.writer.write(canny_name, edges, "canny")  # writes image on the directory
+        source = self.blur_source if self.blur_entry is not None and self.blur_entry.blur is blur else blur_name
+        self.catalog.addOutput(canny_name, self.img_index, self.sourceName(source), "canny",
+                               self.kernel_size, gauss[1], thr[0], thr[1], thr[2], 3)
+        if self.verbose:
+            print("Canny Edge image saved as " + canny_name)    # send message to terminal
+        return(canny_name, edges)
+
+        # Gaussian blur. 'img' is the captured frame; it is read from 'img_name' if not given.
+        # Results are cached, so only new Gauss parameters or a new image are blurred again.
+        # The blurred image is only written to disk when 'save_blurred' is set.
+    def blurImage(self, img_name, img=None):
         gauss = self.getGaussParameters()                   # get Gauss filter parameters
         # name of blurred image
         blur_name = self.blur_dir.format(self.img_index, gauss[0], gauss[1])
-        blur = cv2.GaussianBlur(gray, self.kernel_size, gauss[1])   # perform gaussian blur
-        cv2.imwrite(blur_name, blur)                        # writes blurred image to directory
-        print("Blurred image saved as " + blur_name)        # send message to terminal
-        return(blur_name)
+        key = (img_name, self.kernel_size, gauss[1])        # cache key
+        entry = self.blur_cache.get(key)
+        if entry is None:                                   # not blurred with these parameters yet
+            gray = self.blur_cache.get((img_name,))
+            if gray is None:                                # not converted to grayscale yet
+                if img is None:                             # no image in memory
+                    img = self.writer.read(img_name, self.outputKind(img_name))    # read image
+                if img.ndim == 3:                           # color image
+                    with self.stats.stage("grayscale"):
+                        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)    # grayscale image
+                else:                                       # else:
+                    gray = img                              # already grayscale
+                self.blur_cache.put((img_name,), gray, gray.nbytes)
+            with self.stats.stage("blur"):
+                blur = cv2.GaussianBlur(gray, self.kernel_size, gauss[1])   # perform gaussian blur
+            entry = BlurEntry(blur)
+            self.blur_cache.put(key, entry, blur.nbytes)
+        self.blur_entry = entry                             # lets 'getThresholds' reuse the median
+        self.blur_source = img_name
+        # blurred image is an optional output, written again when another image (e.g. REF) took its name
+        if self.save_blurred and (entry.file_name is None or self.blur_files.get(entry.file_name) != key):
+            entry.file_name = self.writer.write(blur_name, entry.blur, "blur")  # writes blurred image to directory
+            self.blur_files[entry.file_name] = key
+            self.catalog.addOutput(entry.file_name, self.img_index, self.sourceName(img_name), "blur",
+                                   self.kernel_size, gauss[1])
+            if self.verbose:
+                print("Blurred image saved as " + entry.file_name)  # send message to terminal
+        if entry.file_name is not None:
+            blur_name = entry.file_name
+        return(blur_name, entry.blur)
 
         # Determine threshold values. Called by 'cannyEdges'
-    def getThresholds(self, blur_name):
+    def getThresholds(self, blur_name, blur=None):
         if self.manual_canny:                               # if manual checkbox is checked
             sigma = ""                                      # sigma value N/A
             thr_1 = self.h_threshold1                       # get threshold 1 value
             thr_2 = self.h_threshold2                       # get threshold 2 value
         else:                                               # else: use method by Adrian Rosebrock
             sigma = self.sigma                              # get sigma value
-            blur = cv2.imread(blur_name)                    # read blur image
-            v = np.median(blur)                             # calculate median
-            thr_1 = int(max(0, (1.0 - sigma) * v))          # calculate Threshold 1
-            thr_2 = int(min(255, (1.0 + sigma) * v))        # calculate Threshold 2
+            entry = self.blur_entry
+            if entry is not None and blur is not None and entry.blur is blur:   # image from 'blurImage'
+                v = entry.medians.get(self.median_stride)
+                if v is None:                               # not calculated yet
+                    with self.stats.stage("median"):
+                        v = imageMedian(blur, self.median_stride)   # calculate median once
+                    entry.medians[self.median_stride] = v
+            else:                                           # else:
+                if blur is None:                            # no image in memory
+                    blur = self.writer.read(blur_name, "blur", cv2.IMREAD_GRAYSCALE)    # read blur image
+                with self.stats.stage("median"):
+                    v = imageMedian(blur, self.median_stride)   # calculate median
+            thr_1, thr_2 = autoThresholds(v, sigma)         # calculate Threshold 1 and 2
         return(sigma, thr_1, thr_2)
 
+    def sourceName(self, img_name):                         # actual file name of a source image
+        if img_name == self.ref_dir:
+            return self.writer.fileName(img_name, "reference")
+        if img_name == self.img_dir.format(self.img_index):
+            return self.writer.fileName(img_name, "capture")
+        return img_name                                     # file given by name (batch jobs)
+
+        # Canny outputs of image 'img_index' with the current settings, for resuming batch jobs
+    def cannyOutputs(self, img_index):
+        params = {"img_index": img_index, "kind": "canny", "kernel_size": self.kernel_size,
+                  "std_deviation": self.std_Deviation}
+        if self.manual_canny:
+            params.update(threshold_1=self.h_threshold1, threshold_2=self.h_threshold2)
+        else:
+            params.update(sigma=self.sigma)
+        found = [row["path"] for row in self.catalog.outputs(**params) if os.path.exists(row["path"])]
+        if found:
+            return found
+        gauss = self.getGaussParameters()                   # outputs made before the catalog existed
+        if self.manual_canny:                               # name is known in advance
+            name = self.writer.fileName(self.canny_dir.format(img_index, gauss[0], gauss[1], "",
+                                                              self.h_threshold1, self.h_threshold2), "canny")
+            return [name] if os.path.exists(name) else []
+        prefix = self.canny_dir.format(img_index, gauss[0], gauss[1], self.sigma, 0, 0).rsplit("-", 1)[0]
+        pattern = glob.escape(prefix + "-") + "*" + self.writer.fileName("", "canny")  # thresholds depend on the image
+        return glob.glob(pattern)
+
     def getGaussParameters(self):
         k_size = self.kernel_size                           # get kernel size
         k_size_str = str(k_size).replace(" ", "")           # remove blank spaces in k_size
         return(k_size_str, self.std_Deviation)
 
         # Display image. Called by 'cannyEdges'
-    def displayImage(self, canny_name):
+    def displayImage(self, canny_name, edges=None):
         if self.show_canny_image:                           # if Checkbox is checked
-            img = Image.open(canny_name)                    # open processed image
-            img.show()                                      # and display it
+            if edges is None:                               # no image in memory
+                edges = self.writer.read(canny_name, "canny", cv2.IMREAD_GRAYSCALE)  # open processed image
+            self.showResult(edges)                          # and display it
         else:                                               # else:
             pass                                            # do nothing
 
+        # Shows an image in the window's result view. May be called from any thread.
+    def showResult(self, img):
+        if self.result_view is not None:
+            self.result_view.setFrame(img)
+
     def checkIfImageExists(self, img_name):
         if not os.path.exists(img_name):                    # if the image does not exists
             print("WARNING: No image available.")           # show message in the terminal
         else:                                               # else:
             pass                                            # do nothing
 
+        # Records frames at the full camera rate into memory. Called by the 'Burst' button.
+    def burstCapture(self):
+        recorder = BurstRecorder(self.grabber, self.burst_frames, self.burst_seconds, self.grabber.fps())
+        try:
+            recorder.start()
+        except RuntimeError as e:
+            print("WARNING: {}".format(e))
+            return
+        print("Recording burst of up to {} frames".format(recorder.size))
+        thread = threading.Thread(target=self.saveBurst, args=(recorder,))
+        thread.daemon = True                                # frames are saved in the background
+        thread.start()
+
+        # Saves a recorded burst once it is complete. Called by 'burstCapture'.
+    def saveBurst(self, recorder):
+        recorder.wait()
+        frames = recorder.frames()
+        if not len(frames):
+            print("WARNING: No frames recorded.")
+            return
+        seconds = recorder.timestamps[len(frames) - 1] - recorder.timestamps[0]
+        burst_index = self.catalog.nextIndex("burst_index")
+        burst_name = self.burst_dir.format(burst_index)
+        device = self.source.device
+        if self.burst_format == "spool":                    # one raw, memory-mappable file
+            burst_name += ".raw"
+            if not os.path.exists(os.path.dirname(burst_name)):
+                os.makedirs(os.path.dirname(burst_name))
+            spool = FrameSpool(burst_name, len(frames) / seconds if seconds else 0)
+            for frame, timestamp in zip(frames, recorder.timestamps):
+                spool.write(frame, timestamp)
+            spool.close()
+            self.catalog.addCapture(burst_name, burst_index, "burst", device, recorder.timestamps[0])
+        else:                                               # one image per frame
+            if not os.path.exists(burst_name):
+                os.makedirs(burst_name)
+            for i, frame in enumerate(frames):              # buffer is not reused: no copies needed
+                file_name = self.writer.write(burst_name + "/frame_{:04d}.png".format(i), frame, "capture")
+                self.catalog.addCapture(file_name, burst_index, "burst", device, recorder.timestamps[i])
+        print("Saved burst of {} frames ({:.1f} fps) as {}".format(
+            len(frames), (len(frames) - 1) / seconds if seconds else 0, burst_name))
+
+        # Starts or stops continuous recording. Called by the 'Record' button.
+    def recordCapture(self):
+        if self.recorder is None:
+            index = self.catalog.nextIndex("recording_index")
+            file_name = self.record_dir.format(index) + (".raw" if self.record_format == "spool" else ".avi")
+            if not os.path.exists(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            self.recorder = VideoRecorder(self.grabber, file_name, self.grabber.fps())
+            self.recorder.start()
+            self.catalog.addCapture(file_name, index, "recording", self.source.device, time.time())
+            print("Recording to {}".format(file_name))
+        else:
+            recorder, self.recorder = self.recorder, None
+            recorder.stop()                                 # writes the frames still queued
+            print("Recorded {} frames ({} dropped) to {}".format(recorder.count, recorder.dropped,
+                                                                recorder.file_name))
+
+        # Runs every frame of a recording (video, .raw spool or burst folder) through blur and Canny.
+        # Outputs are named through 'img_index', so no other thread may use this Capture meanwhile.
+    def processSequence(self, file_name):
+        if os.path.isdir(file_name):                        # burst folder
+            source = ImageSequenceSource(sorted(os.path.join(file_name, f) for f in os.listdir(file_name)
+                                                if f.lower().endswith(IMAGE_EXTENSIONS)))
+        elif file_name.endswith(".raw"):                    # raw frame spool
+            source = SpoolSource(file_name)
+        else:                                               # video file
+            source = VideoFileSource(file_name, loop=False, realtime=False)
+        if not source.open():
+            print("WARNING: Cannot open {}".format(file_name))
+            return 0
+        stem = os.path.splitext(os.path.basename(file_name.rstrip("/")))[0]
+        count = 0
+        img_index = self.img_index
+        try:
+            while True:
+                ret, frame = source.read()
+                if not ret:
+                    break
+                self.img_index = "{}_{:04d}".format(stem, count)    # names outputs per frame
+                img_name = self.playback_dir.format(stem, count)
+                blur_name, blur = self.blurImage(img_name, frame)   # perform Gaussian Blur
+                self.cannyEdges(blur_name, blur)            # perform Canny Edge detection
+                self.blur_cache.invalidate(img_name)        # frames are not processed again
+                count += 1
+        finally:
+            self.img_index = img_index
+            source.release()
+        print("Processed {} frames of {}".format(count, file_name))
+        return count
+
+        # Gaussian and Canny parameters, to process with the same settings elsewhere
+    def processingSettings(self):
+        return {"kernel_size": self.kernel_size, "std_Deviation": self.std_Deviation, "sigma": self.sigma,
+                "manual_canny": self.manual_canny, "h_threshold1": self.h_threshold1,
+                "h_threshold2": self.h_threshold2, "save_blurred": self.save_blurred,
+                "median_stride": self.median_stride}
+
+        # 'processSequence' on a separate headless Capture with the same settings and directories,
+        # so pictures can still be taken meanwhile. Called by 'File > Process Recording...' and
+        # 'File > Process Burst Folder...'.
+    def processRecording(self, file_name):
+        playback = headlessCapture(self.root, self.processingSettings())
+        try:
+            return playback.processSequence(file_name)
+        finally:
+            playback.close()
+
+        # Indexes captured images missing from the descriptor index (saved before indexing existed)
+        # on its background thread, after the store is loaded. Started when the Capture is created.
+    def indexLibrary(self):
+        a_dir = os.path.dirname(self.img_dir)
+        return self.descriptor_index.addDirectoryAsync(a_dir, lambda name: name.startswith("img_") and
+                                                       name.lower().endswith(IMAGE_EXTENSIONS))  # not '.part'
+
+        # Finds the captured images most similar to the current frame. Called by the 'Match' button.
     def matchImage(self):
-        img1 = cv2.imread("/home/edgardo/Pictures/CamView/4-processed/canny_1_(7,7):1-90:200.png")
-        img2 = cv2.imread("/home/edgardo/Pictures/CamView/4-processed/canny_2_(7,7):1-90:200.png")
+        img1 = self.grabFrame()                             # current frame
+        if img1 is None:
+            return
+        if not self.library_indexing.done():                # the window stays responsive
+            print("Still indexing captured images, matching against the ones indexed so far.")
+        img3 = self.findMatch(img1)
+        if img3 is not None:
+            self.showResult(img3)
+
+        # Finds the captured image most similar to 'img1' and draws their matches side by side.
+        # Returns None when nothing matches. Called by 'matchImage'.
+    def findMatch(self, img1):
+        ranking = self.descriptor_index.query(img1)
+        if not ranking:
+            print("WARNING: No matching image.")
+            return None
+        if self.verbose:
+            for name, votes in ranking:
+                print("{}: {} matches".format(name, votes))
+        img2 = readImage(os.path.dirname(self.img_dir) + "/" + ranking[0][0])   # best match
+        if img2 is None:
+            print("WARNING: {} no longer exists.".format(ranking[0][0]))
+            return None
 
         orb = cv2.ORB_create()
         kp1, des1 = orb.detectAndCompute(img1, None)
@@ -212,31 +2012,178 @@ class Capture():
         bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
         matches = bf.match(des1, des2)
         matches = sorted(matches, key = lambda x:x.distance)
-        img3 = cv2.drawMatches(img1, kp1, img2, kp2, matches[:40], img2, flags = 2)
-        plt.imshow(img3),plt.show()
+        return cv2.drawMatches(img1, kp1, img2, kp2, matches[:40], img2, flags = 2)
+
+        # Builds the sweep for one of the 'Swipe' menu entries from the current settings
+    def parameterSweep(self, kind):
+        manual = self.manual_canny
+        thresholds_1 = (self.h_threshold1,) if manual else (None,)
+        thresholds_2 = (self.h_threshold2,) if manual else (None,)
+        sweep = ParameterSweep(kernel_sizes=(self.kernel_size[0],), std_deviations=(self.std_Deviation,),
+                               thresholds_1=thresholds_1, thresholds_2=thresholds_2, sigma=self.sigma)
+        sweep.encoding = self.writer.encoding("canny")      # same format as Canny outputs
+        if kind == "gaussian":                              # same ranges as the spinboxes
+            sweep.kernel_sizes = (1, 3, 5, 7, 9)
+            sweep.std_deviations = range(1, 11)
+        elif kind == "hysteresis":
+            sweep.thresholds_1 = range(0, 301, 30)
+            sweep.thresholds_2 = range(0, 301, 30)
+        elif kind == "aperture":                            # Sobel aperture sizes supported by Canny
+            sweep.apertures = (3, 5, 7)
+        else:
+            raise ValueError("Unknown sweep: {}".format(kind))
+        return sweep
+
+        # Sweeps Gaussian, threshold or aperture values. Called by the 'Swipe' menu.
+    def sweepParameters(self, kind):
+        img_index = self.img_index                          # pictures taken meanwhile do not change it
+        img_name = self.img_dir.format(img_index)           # current image
+        img = self.lastPicture(img_name)                    # captured frame, if still in memory
+        if img is None:
+            if not os.path.exists(self.writer.fileName(img_name, "capture")):
+                print("WARNING: No image available.")
+                return
+            img = self.writer.read(img_name, "capture")
+        sweep = self.parameterSweep(kind)
+        out_dir = self.sweep_dir.format(img_index, kind)
+        print("Sweeping {} combinations into {}".format(sweep.size(), out_dir))
+        thread = threading.Thread(target=self.runSweep,
+                                  args=(sweep, img, out_dir, img_index, self.sourceName(img_name)))
+        thread.daemon = True                                # the window stays responsive
+        thread.start()
+        return thread
+
+    def runSweep(self, sweep, img, out_dir, img_index, source):
+        start = time.time()
+        rows = sweep.run(img, out_dir)
+        for number, kernel_size, std, sigma, thr_1, thr_2, aperture, file_name in rows:
+            if file_name is not None:
+                self.catalog.addOutput(file_name, img_index, source, "sweep", kernel_size, std,
+                                       sigma, thr_1, thr_2, aperture)
+        print("Sweep of {} images done in {:.1f} s".format(len(rows), time.time() - start))
 
     def takePicture(self):                                  # Called by the 'Take Picture' button
-        self.savePicture()                                  # take a picture
+        with self.lock:
+            self.savePicture()                              # take a picture
+
+    def outputKind(self, img_name):                         # writer output kind of a captured image
+        return "reference" if img_name == self.ref_dir else "capture"
+
+    def lastPicture(self, img_name):                        # frame of 'img_name' if still in memory
+        name, frame = self.last_picture
+        return frame if name == img_name else None          # None: read it from disk
 
     def detectEdges(self):                                  # Called by the 'Detect Edges' button
-        img_name = self.img_dir.format(self.img_index)      # define image name
-        blur_name = self.blurImage(img_name)                # perform Gaussian Blur
-        canny_name = self.cannyEdges(blur_name)             # perform Canny Edge detection
-        self.displayImage(canny_name)                       # display processed image (or not)
+        with self.lock:
+            img_name = self.img_dir.format(self.img_index)  # define image name
+            img = self.lastPicture(img_name)                # captured frame, if still in memory
+            blur_name, blur = self.blurImage(img_name, img) # perform Gaussian Blur
+            canny_name, edges = self.cannyEdges(blur_name, blur)    # perform Canny Edge detection
+        self.displayImage(canny_name, edges)                # display processed image (or not)
 
     def backgroundReference(self):                          # Called by the 'Background Reference' button
-        bck_name = self.ref_dir                             # define background name
-        self.saveBackground()                               # take a picture of the background
-        blur_name = self.blurImage(bck_name)                # perform Gaussian Blur
-        canny_name = self.cannyEdges(blur_name)             # perform Canny Edge detection
-        self.displayImage(canny_name)                       # display processed image (or not)
+        with self.lock:
+            bck_name = self.ref_dir                         # define background name
+            img = self.saveBackground()                     # take a picture of the background
+            if img is None:                                 # no frame available
+                return
+            blur_name, blur = self.blurImage(bck_name, img) # perform Gaussian Blur
+            canny_name, edges = self.cannyEdges(blur_name, blur)    # perform Canny Edge detection
+        self.displayImage(canny_name, edges)                # display processed image (or not)
+
+class FrameView(QtGui.QWidget):
+    """Widget painting NumPy images (grayscale or BGR) inside the window.
+
+    'setFrame' may be called from any thread and only keeps the newest
+    image: frames arriving faster than the screen refreshes replace each
+    other (counted in 'coalesced') instead of queueing up. A timer running
+    at 'refresh_rate' wraps the newest image in a QImage and repaints.
+    Grayscale images are painted from their own buffer through an indexed
+    QImage; BGR images are converted to RGB into a buffer reused for every
+    frame, as Qt 4 has no BGR format. Images must not be modified after
+    they are passed to 'setFrame'.
+    """
+    GRAY_TABLE = [QtGui.qRgb(i, i, i) for i in range(256)]     # indexed 8-bit as grayscale
+
+    def __init__(self, parent=None, refresh_rate=60, stats=None):
+        super(FrameView, self).__init__(parent)
+        self.stats = stats or NO_STATS
+        self.lock = threading.Lock()
+        self.pending = None                                 # (image, text) not painted yet
+        self.image = None                                   # QImage being shown
+        self.buffer = None                                  # array behind 'image', must outlive it
+        self.rgb = None                                     # reused BGR to RGB buffer
+        self.text = None                                    # overlay, e.g. live FPS
+        self.painted = 0                                    # frames shown
+        self.coalesced = 0                                  # frames replaced before they were shown
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)    # the whole widget is painted
+        self.timer = QtCore.QTimer(self)                    # repaints at most once per refresh
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(1000 / refresh_rate))
+
+    def setFrame(self, img, text=None):
+        with self.lock:
+            if self.pending is not None:                    # previous frame never painted
+                self.coalesced += 1
+            self.pending = (img, text)
+
+    def clear(self):
+        with self.lock:
+            self.pending = None
+        self.image = self.buffer = self.text = None
+        self.update()
+
+    def refresh(self):                                      # runs on the GUI thread
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is None:                                 # nothing new since the last paint
+            return
+        with self.stats.stage("display"):
+            self.image = self.toQImage(pending[0])
+            self.text = pending[1]
+            self.painted += 1
+            self.repaint()
+
+    def toQImage(self, img):
+        """QImage sharing the pixels of 'img', or of its RGB conversion."""
+        if img.ndim == 2:                                   # grayscale: no copy
+            data = img if img.flags.c_contiguous and img.flags.writeable else img.copy()
+            fmt = QtGui.QImage.Format_Indexed8
+        else:                                               # BGR: one conversion into 'rgb'
+            if self.rgb is None or self.rgb.shape != img.shape:
+                self.rgb = np.empty(img.shape, np.uint8)
+            cv2.cvtColor(img, cv2.COLOR_BGR2RGB, self.rgb)
+            data = self.rgb
+            fmt = QtGui.QImage.Format_RGB888
+        # a writable pointer: a read-only buffer would be copied by 'setColorTable'
+        image = QtGui.QImage(sip.voidptr(data.ctypes.data), data.shape[1], data.shape[0], data.strides[0], fmt)
+        if fmt == QtGui.QImage.Format_Indexed8:
+            image.setColorTable(self.GRAY_TABLE)
+        self.buffer = data                                  # QImage does not own the pixels
+        return image
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.black)
+        if self.image is not None:                          # scaled to fit, centered
+            size = self.image.size()
+            size.scale(self.size(), QtCore.Qt.KeepAspectRatio)
+            target = QtCore.QRect(QtCore.QPoint(0, 0), size)
+            target.moveCenter(self.rect().center())
+            painter.drawImage(target, self.image)
+        if self.text:
+            painter.setPen(QtCore.Qt.green)
+            painter.drawText(5, 15, self.text)
+        painter.end()
 
 class Window(QtGui.QMainWindow):
 
-    # Initializations
-    def __init__(self):
+    # Initializations. 'source' and 'root' are passed to the Capture (default: camera 0).
+    def __init__(self, source=None, root=None):
         super(Window, self).__init__()
-        self.setGeometry(50, 50, 600, 300)
+        self.source = source
+        self.root = root
+        self.setGeometry(50, 50, 900, 760)
         self.setWindowTitle("CamView")
         self.setWindowIcon(QtGui.QIcon("./icons/opencv_logo.png"))
 
@@ -245,23 +2192,38 @@ class Window(QtGui.QMainWindow):
         extractAction1.setStatusTip('Leave the App')
         extractAction1.triggered.connect(self.close_application)
 
+        extractAction5 = QtGui.QAction("&Process Recording...", self)
+        extractAction5.setStatusTip('Detect edges on every frame of a recording')
+        extractAction5.triggered.connect(self.process_recording)
+
+        extractAction7 = QtGui.QAction("Process &Burst Folder...", self)
+        extractAction7.setStatusTip('Detect edges on every image of a burst saved as images')
+        extractAction7.triggered.connect(self.process_burst)
+
+        extractAction6 = QtGui.QAction("&Export Stats...", self)
+        extractAction6.setStatusTip('Save the timings of this session as JSON or CSV')
+        extractAction6.triggered.connect(self.export_stats)
+
         extractAction2 = QtGui.QAction("&Gaussian Filter", self)
         extractAction2.setStatusTip('Swipe all values in the Gaussian Filter')
-        extractAction2.triggered.connect(self.close_application)
+        extractAction2.triggered.connect(lambda: self.capture.sweepParameters("gaussian"))
 
         extractAction3 = QtGui.QAction("&Hysteresis Threshold", self)
         extractAction3.setStatusTip('Swipe all values in the Hysteresis Threshold')
-        extractAction3.triggered.connect(self.close_application)
+        extractAction3.triggered.connect(lambda: self.capture.sweepParameters("hysteresis"))
 
         extractAction4 = QtGui.QAction("&Aperture Size", self)
         extractAction4.setStatusTip('Swipe all values for Sobel operator')
-        extractAction4.triggered.connect(self.close_application)
+        extractAction4.triggered.connect(lambda: self.capture.sweepParameters("aperture"))
 
         self.statusBar()
 
         mainMenu = self.menuBar()
 
         fileMenu1 = mainMenu.addMenu('&File')
+        fileMenu1.addAction(extractAction5)
+        fileMenu1.addAction(extractAction7)
+        fileMenu1.addAction(extractAction6)
         fileMenu1.addAction(extractAction1)
 
         fileMenu2 = mainMenu.addMenu('&Swipe')
@@ -288,7 +2250,7 @@ class Window(QtGui.QMainWindow):
         self.spinboxStatus = True                       # Initilize variable for active or grayed-out spinboxes
 
         # Start capture button
-        self.capture = Capture()
+        self.capture = Capture(self.source, self.root)
         btn = QtGui.QPushButton("Start", self)
         btn.clicked.connect(self.capture.startCapture)
         btn.resize(55,50)                               # Use 'btn.resize(btn.sizeHint())' for minimum size
@@ -330,6 +2292,70 @@ class Window(QtGui.QMainWindow):
         btn.resize(115,25)
         btn.move(410,230)
 
+        # Burst button: records 'burst_frames' frames at the full camera rate
+        btn = QtGui.QPushButton("Burst", self)
+        btn.clicked.connect(self.capture.burstCapture)
+        btn.resize(55,30)
+        btn.move(25,360)
+
+        # Record button: starts / stops continuous recording
+        btn = QtGui.QPushButton("Record", self)
+        btn.setCheckable(True)
+        btn.clicked.connect(self.capture.recordCapture)
+        btn.resize(55,30)
+        btn.move(85,360)
+
+        # Checkbox to run edge detection on the live capture
+        cbx = QtGui.QCheckBox("Live Edges", self)
+        cbx.resize(115,30)
+        cbx.move(25, 260)
+        cbx.stateChanged.connect(self.capture.liveEdgesCheckBox)
+
+        llab = QtGui.QLabel("Scale:", self)
+        llab.move(25, 290)
+
+        # Combobox for processing scale of live edge detection
+        cmb = QtGui.QComboBox(self)
+        cmb.move(75, 290)
+        cmb.setFixedWidth(65)
+        cmb.addItems(["1", "1/2", "1/4"])
+        cmb.currentIndexChanged.connect(self.capture.liveScale)
+
+        llab = QtGui.QLabel("FPS:", self)
+        llab.move(25, 325)
+
+        # Spinbox for target FPS of live edge detection
+        spn = QtGui.QSpinBox(self)
+        spn.move(75, 325)
+        spn.setFixedWidth(65)
+        spn.setRange(1,60)
+        spn.setValue(15)
+        spn.valueChanged.connect(self.capture.liveFps)
+
+        # Checkbox to take pictures when the image changes
+        cbx = QtGui.QCheckBox("Motion Trigger", self)
+        cbx.resize(155,30)
+        cbx.move(410, 260)
+        cbx.stateChanged.connect(self.capture.motionCheckBox)
+
+        mlab = QtGui.QLabel("Motion %:", self)
+        mlab.move(410, 290)
+
+        # Spinbox for changed pixels (%) that trigger a picture
+        spn = QtGui.QDoubleSpinBox(self)
+        spn.move(480, 290)
+        spn.setFixedWidth(65)
+        spn.setRange(.1,50)
+        spn.setValue(2)
+        spn.setSingleStep(0.5)
+        spn.valueChanged.connect(self.capture.motionFraction)
+
+        # Checkbox to detect edges on pictures taken by the motion trigger
+        cbx = QtGui.QCheckBox("Motion Edges", self)
+        cbx.resize(155,30)
+        cbx.move(410, 320)
+        cbx.stateChanged.connect(self.capture.motionEdgesCheckBox)
+
         # Checkbox to automatically open canny image after processing
         cbx = QtGui.QCheckBox("Open Image", self)
         cbx.resize(135,30)
@@ -404,13 +2430,94 @@ class Window(QtGui.QMainWindow):
         self.spn4.valueChanged.connect(self.capture.hysteresisThreshold_2)
         self.spn4.setEnabled(not self.spinboxStatus)
 
+        # Checkbox to collect per-stage timings
+        cbx = QtGui.QCheckBox("Collect Stats", self)
+        cbx.resize(155,30)
+        cbx.move(590, 30)
+        cbx.setChecked(self.capture.stats.enabled)
+        cbx.stateChanged.connect(self.capture.statsCheckBox)
+
+        # Panel showing latencies, FPS and queue depths
+        self.stats_panel = QtGui.QPlainTextEdit(self)
+        self.stats_panel.setReadOnly(True)
+        self.stats_panel.setGeometry(590, 60, 290, 330)
+        self.stats_panel.setFont(QtGui.QFont("Monospace", 8))
+        self.stats_timer = QtCore.QTimer(self)          # refreshes the stats panel
+        self.stats_timer.timeout.connect(self.refresh_stats)
+        self.stats_timer.start(1000)
+
+        # Live capture and result (edges, matches) views
+        self.live_view = FrameView(self, stats=self.capture.stats)
+        self.live_view.setGeometry(25, 405, 420, 315)
+        self.capture.live_view = self.live_view
+        self.result_view = FrameView(self, stats=self.capture.stats)
+        self.result_view.setGeometry(460, 405, 420, 315)
+        self.capture.result_view = self.result_view
+        self.capture.stats.gauge("display coalesced", lambda: self.live_view.coalesced)
+
+        # Camera state in the status bar: the camera opens in the background
+        self.connection_label = QtGui.QLabel(self)
+        self.statusBar().addPermanentWidget(self.connection_label)
+        self.connection_timer = QtCore.QTimer(self)     # polls until the camera is open
+        self.connection_timer.timeout.connect(self.refresh_connection)
+        self.connection_timer.start(100)
+        self.refresh_connection()
+
         self.show()
 
     # Methods
+    def process_recording(self):
+        file_name = QtGui.QFileDialog.getOpenFileName(self, "Process Recording",
+                                                      os.path.dirname(self.capture.record_dir),
+                                                      "Recordings (*.avi *.raw *.mp4)")
+        if file_name:
+            self.start_processing(str(file_name))
+
+    def process_burst(self):                            # bursts are folders of images by default
+        dir_name = QtGui.QFileDialog.getExistingDirectory(self, "Process Burst Folder",
+                                                          os.path.dirname(self.capture.burst_dir))
+        if dir_name:
+            self.start_processing(str(dir_name))
+
+    def start_processing(self, file_name):
+        thread = threading.Thread(target=self.capture.processRecording, args=(file_name,))
+        thread.daemon = True                            # processed in the background
+        thread.start()
+
+    def refresh_connection(self):
+        state = self.capture.connectionState()
+        messages = {"connecting": "Connecting to camera {}...", "connected": "Camera {} connected",
+                    "failed": "Camera {} not available", "headless": "No camera"}
+        device = self.capture.source.device if self.capture.source is not None else ""
+        self.connection_label.setText(messages[state].format(device))
+        if state != "connecting":
+            self.connection_timer.stop()
+
+    def refresh_stats(self):
+        if self.capture.stats.enabled:
+            self.stats_panel.setPlainText(self.capture.stats.report())
+
+    def export_stats(self):
+        file_name = QtGui.QFileDialog.getSaveFileName(self, "Export Stats",
+                                                      os.path.join(os.path.dirname(self.capture.catalog_dir), "stats.json"),
+                                                      "Stats (*.json *.csv)")
+        if file_name:
+            file_name = str(file_name)
+            if file_name.lower().endswith(".csv"):
+                self.capture.stats.exportCsv(file_name)
+            else:
+                self.capture.stats.exportJson(file_name)
+            print("Stats saved to: " + file_name)
+
+    def closeEvent(self, event):                        # title bar button or Alt+F4
+        self.capture.close()                            # write queued images, finish recordings
+        event.accept()
+
     def close_application(self):
         choice = QtGui.QMessageBox.question(self, 'Extract!', "Exit application?", QtGui.QMessageBox.Yes | QtGui.QMessageBox.No)
         if choice == QtGui.QMessageBox.Yes:
             print("Program terminated by user")
+            self.capture.quitCapture()                  # stop grabber and release the camera
             sys.exit()
         else:
             pass
@@ -421,9 +2528,363 @@ class Window(QtGui.QMainWindow):
         self.spn4.setEnabled(not self.spinboxStatus)    # Refresh status for spn4
         self.spn5.setEnabled(self.spinboxStatus)        # Refresh status for spn5
 
-def run():
-    app = QtGui.QApplication(sys.argv)
-    GUI = Window()
+def headlessCapture(root, settings):
+    """Capture without camera or display for processing files, with 'settings' applied."""
+    capture = Capture(root=root, headless=True)
+    capture.verbose = False
+    capture.blur_cache.max_bytes = 0                        # every image is blurred once
+    for name, value in settings.items():                    # kernel_size, sigma, manual_canny...
+        setattr(capture, name, value)
+    return capture
+
+def workerInit():                                           # common setup of batch and station workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)            # Ctrl+C is handled by the parent process
+    cv2.setNumThreads(1)                                    # parallelism comes from the pool
+
+batch_capture = None                # headless Capture of each batch worker process
+
+def batchInit(root, settings):                              # Process pool initializer for batch jobs
+    global batch_capture
+    workerInit()
+    batch_capture = headlessCapture(root, settings)
+
+def imageIndex(file_name):                                  # 'N' of img_N, or the bare file name
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    match = re.match(r"img_(\d+)$", name)
+    return int(match.group(1)) if match else name
+
+def batchProcess(job):
+    """Run blur, thresholds and Canny on one image in a batch worker.
+
+    'job' is (file_name, force). Returns (file_name, status, seconds) with
+    status "done", "skipped" (output exists) or an error message.
+    """
+    file_name, force = job
+    start = time.time()
+    capture = batch_capture
+    try:
+        capture.img_index = imageIndex(file_name)           # names outputs like 'detectEdges'
+        if not force and capture.cannyOutputs(capture.img_index):
+            return (file_name, "skipped", time.time() - start)
+        img = readImage(file_name)
+        if img is None:
+            return (file_name, "unreadable image", time.time() - start)
+        blur_name, blur = capture.blurImage(file_name, img) # perform Gaussian Blur
+        capture.cannyEdges(blur_name, blur)                 # perform Canny Edge detection
+        return (file_name, "done", time.time() - start)
+    except Exception as e:
+        return (file_name, str(e), time.time() - start)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp", ".tiff", ".tif", ".npy")
+
+def batchInputs(inputs, capture_dir):
+    """Yield image files from directories, glob patterns, 'N-M' index ranges or file names."""
+    for item in inputs:
+        index_range = re.match(r"^(\d+)-(\d+)$", item)
+        if index_range:                                     # img_N to img_M of the capture directory
+            for index in range(int(index_range.group(1)), int(index_range.group(2)) + 1):
+                for extension in IMAGE_EXTENSIONS:
+                    file_name = "{}/img_{}{}".format(capture_dir, index, extension)
+                    if os.path.isfile(file_name):
+                        yield file_name
+                        break
+        elif os.path.isdir(item):
+            for file_name in sorted(os.listdir(item)):
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(item, file_name)
+        elif glob.has_magic(item):
+            for file_name in sorted(glob.iglob(item)):
+                yield file_name
+        else:
+            yield item
+
+def pipelineSettings(args):                                 # Capture attributes from command line options
+    settings = {"kernel_size": (args.kernel, args.kernel), "std_Deviation": args.std,
+                "sigma": args.sigma, "save_blurred": args.save_blurred}
+    if args.thresholds:
+        settings.update(manual_canny=True, h_threshold1=args.thresholds[0], h_threshold2=args.thresholds[1])
+    return settings
+
+def play(args):
+    """Run every frame of recordings through the edge-detection pipeline."""
+    capture = headlessCapture(args.root, pipelineSettings(args))
+    start = time.time()
+    count = sum(capture.processSequence(file_name) for file_name in args.recordings)
+    capture.close()
+    elapsed = time.time() - start
+    print("Processed {} frames in {:.1f} s ({:.1f} frames/s)".format(count, elapsed, count / max(elapsed, 1e-6)))
+    return 0 if count else 1
+
+def batch(args):
+    """Process images headless on a process pool and print a throughput summary."""
+    settings = pipelineSettings(args)
+    root = args.root or os.path.expanduser("~") + "/Pictures/CamView"
+    jobs = ((file_name, args.force) for file_name in batchInputs(args.inputs, root + "/1-captured"))
+    counts = collections.Counter()
+    busy = 0.0
+    start = time.time()
+    pool = processPool(args.workers, initializer=batchInit, initargs=(root, settings))
+    try:
+        for file_name, status, seconds in pool.imap_unordered(batchProcess, jobs, args.chunksize):
+            if status in ("done", "skipped"):               # streamed: results arrive as they finish
+                counts[status] += 1
+            else:
+                counts["failed"] += 1
+                print("WARNING: {}: {}".format(file_name, status))
+            busy += seconds
+            total = sum(counts.values())
+            if args.progress and total % args.progress == 0:
+                print("{} images ({:.1f}/s)".format(total, total / (time.time() - start)))
+    except KeyboardInterrupt:                               # queued images are dropped: run again to resume
+        print("Interrupted, stopping workers...")
+        pool.terminate()
+        interrupted = True
+    else:
+        pool.close()
+        interrupted = False
+    pool.join()
+    elapsed = time.time() - start
+    print("Processed {} images, skipped {}, failed {} in {:.1f} s".format(
+        counts["done"], counts["skipped"], counts["failed"], elapsed))
+    if counts["done"]:
+        print("Throughput: {:.1f} images/s, {:.1f} ms per image per worker".format(
+            counts["done"] / elapsed, 1000 * busy / sum(counts.values())))
+    if interrupted:
+        print("Run the same command again to process the remaining images.")
+    return 1 if counts["failed"] or interrupted else 0
+
+station_captures = {}              # headless Capture per camera root, in each station worker process
+station_settings = {}
+
+def stationInit(settings):                                  # Process pool initializer for CameraStation
+    global station_settings
+    workerInit()
+    station_settings = settings
+
+def stationProcess(job):
+    """Run blur, thresholds and Canny on one picture of a camera in a station worker.
+
+    'job' is (root, img_index, img_name, frame). Returns (status, seconds)
+    with status "done" or an error message.
+    """
+    root, img_index, img_name, frame = job
+    start = time.time()
+    try:
+        capture = station_captures.get(root)
+        if capture is None:                                 # first picture of this camera here
+            capture = station_captures[root] = headlessCapture(root, station_settings)
+        capture.img_index = img_index                       # names outputs like 'detectEdges'
+        blur_name, blur = capture.blurImage(img_name, frame)    # perform Gaussian Blur
+        capture.cannyEdges(blur_name, blur)                 # perform Canny Edge detection
+        return ("done", time.time() - start)
+    except Exception as e:
+        return (str(e), time.time() - start)
+
+class CameraStation():
+    """Several frame sources captured by one process.
+
+    Every source gets its own Capture (grabber thread, catalog and image
+    index) under 'root'/cam<N>, and a worker taking a picture every
+    'interval' seconds, or whenever motion is detected. Edge detection of
+    the pictures runs on one process pool shared by all sources, so CPU use
+    grows with the number of cameras. At most 'max_pending' pictures of a
+    source wait for the pool; later ones are dropped and counted. FPS,
+    backlog and edge latency of each source are kept in its Capture's stats.
+    """
+    def __init__(self, sources, root=None, settings=None, processes=None, interval=1.0, motion=False,
+                 max_pending=4):
+        if root is None:                                    # default location
+            root = os.path.expanduser("~") + "/Pictures/CamView"
+        self.interval = interval
+        self.motion = motion
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.running = False
+        self.workers = []
+        self.pool = processPool(processes, initializer=stationInit, initargs=(settings or {},))
+        self.captures = []
+        self.pending = []                                   # pictures waiting for the pool, per source
+        for number, source in enumerate(sources):
+            capture = Capture(source, "{}/cam{}".format(root, number), match_index=False)  # no ORB per picture
+            capture.verbose = False
+            capture.show_canny_image = False
+            capture.stats.gauge("pool backlog", lambda number=number: self.pending[number])
+            self.captures.append(capture)
+            self.pending.append(0)
+
+    def start(self):
+        self.running = True
+        for number, capture in enumerate(self.captures):
+            if self.motion:                                 # pictures when the image changes
+                capture.motion = MotionTrigger(capture.grabber, lambda fraction, number=number: self.takePicture(number),
+                                               trigger_fraction=capture.motion_fraction, cooldown=self.interval)
+                capture.motion.start()
+            else:                                           # pictures at a fixed interval
+                worker = threading.Thread(target=self.pictureLoop, args=(number,))
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+    def pictureLoop(self, number):
+        next_time = time.time()
+        while self.running:
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(min(delay, 0.1))                 # stays responsive to 'stop'
+                continue
+            next_time += self.interval
+            if self.captures[number].connectionState() == "connected":
+                self.takePicture(number)
+
+    def takePicture(self, number):
+        """Save a picture of source 'number' and queue its edge detection on the pool."""
+        capture = self.captures[number]
+        with self.lock:
+            if self.pending[number] >= self.max_pending:    # pool is behind on this source
+                capture.stats.count("pictures dropped")
+                return
+            self.pending[number] += 1
+        with capture.lock:
+            index = capture.img_index
+            capture.savePicture()
+            img_name, frame = capture.last_picture
+        if capture.img_index == index:                      # no frame available
+            with self.lock:
+                self.pending[number] -= 1
+            return
+        capture.stats.count("pictures")
+        job = (capture.root, capture.img_index, img_name, frame)
+        queued = time.time()
+        self.pool.apply_async(stationProcess, (job,),
+                              callback=lambda result: self.processed(number, queued, result))
+
+    def processed(self, number, queued, result):            # runs on the pool's result thread
+        status, seconds = result
+        capture = self.captures[number]
+        with self.lock:
+            self.pending[number] -= 1
+        if status == "done":
+            capture.stats.count("edges done")
+        else:
+            capture.stats.count("edges failed")
+            print("WARNING: cam{}: {}".format(number, status))
+        capture.stats.record("edges", seconds)              # processing time in the worker
+        capture.stats.record("edges wait", time.time() - queued - seconds)  # time queued for the pool
+
+    def report(self):
+        """One line per source with its state, FPS, counts and backlog."""
+        lines = ["{:<5} {:<16} {:<10} {:>6} {:>8} {:>8} {:>7} {:>6} {:>7} {:>6} {:>9}".format(
+            "", "source", "state", "fps", "grabbed", "pictures", "backlog", "done", "dropped", "failed",
+            "edges ms")]
+        for number, capture in enumerate(self.captures):
+            snap = capture.stats.snapshot()
+            counters, gauges = snap["counters"], snap["gauges"]
+            edges = snap["stages"].get("edges")
+            lines.append("{:<5} {:<16} {:<10} {:>6.1f} {:>8} {:>8} {:>7} {:>6} {:>7} {:>6} {:>9}".format(
+                "cam{}".format(number), str(capture.source.device)[-16:], capture.connectionState(),
+                gauges["capture fps"] or 0.0, gauges["frames grabbed"], counters.get("pictures", 0),
+                gauges["pool backlog"], counters.get("edges done", 0), counters.get("pictures dropped", 0),
+                counters.get("edges failed", 0), "{:.1f}".format(edges["mean_ms"]) if edges else "-"))
+        return "\n".join(lines)
+
+    def stop(self):
+        self.running = False
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        for capture in self.captures:
+            if capture.motion is not None:
+                capture.motion.stop()
+                capture.motion = None
+
+    def close(self):
+        """Stop taking pictures, wait for queued edge detection and release the sources."""
+        self.stop()
+        self.pool.close()
+        self.pool.join()                                    # finish pictures already taken
+        for capture in self.captures:
+            capture.close()
+
+    def terminate(self):
+        """Like 'close', but pictures still waiting for the pool are not processed."""
+        self.stop()
+        self.pool.terminate()
+        self.pool.join()
+        for capture in self.captures:
+            capture.close()
+
+def multi(args):
+    """Capture from several sources at once until interrupted or for --duration seconds."""
+    station = CameraStation([makeSource(spec) for spec in args.sources], args.root, pipelineSettings(args),
+                            args.workers, args.interval, args.motion, args.max_pending)
+    station.start()
+    deadline = time.time() + args.duration if args.duration else None
+    try:
+        while deadline is None or time.time() < deadline:
+            time.sleep(args.status if deadline is None else max(0, min(args.status, deadline - time.time())))
+            print(station.report())
+    except KeyboardInterrupt:
+        print("Stopping... (press Ctrl+C again to drop the pictures still queued)")
+    try:
+        station.close()
+    except KeyboardInterrupt:
+        print("Stopping now")
+        station.terminate()
+    print(station.report())
+    failed = sum(c.stats.snapshot()["counters"].get("edges failed", 0) for c in station.captures)
+    return 1 if failed else 0
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="CamView", description="Capture images and detect edges.")
+    parser.add_argument("--source", default="0",
+                        help="source of the window: camera index, video file or 'synthetic[:WxH][@FPS]'")
+    commands = parser.add_subparsers(dest="command")
+    play = commands.add_parser("play", help="detect edges on every frame of a recording")
+    play.add_argument("recordings", nargs="+", help="video files, .raw frame spools or burst folders")
+    play.add_argument("--root", help="CamView directory for outputs (default: ~/Pictures/CamView)")
+    bat = commands.add_parser("batch", help="detect edges on saved images without the GUI")
+    bat.add_argument("inputs", nargs="+",
+                     help="image files, directories, glob patterns or 'N-M' ranges of 1-captured/img_N")
+    bat.add_argument("--root", help="CamView directory for outputs (default: ~/Pictures/CamView)")
+    bat.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    bat.add_argument("--chunksize", type=int, default=8, help="images sent to a worker at a time")
+    mul = commands.add_parser("multi", help="capture from several sources, processing edges on all cores")
+    mul.add_argument("sources", nargs="+",
+                     help="camera indices, video files or 'synthetic[:WxH][@FPS]'; outputs go to ROOT/camN")
+    mul.add_argument("--root", help="CamView directory for outputs (default: ~/Pictures/CamView)")
+    mul.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    mul.add_argument("--interval", type=float, default=1.0,
+                     help="seconds between pictures (with --motion: at least between pictures)")
+    mul.add_argument("--motion", action="store_true", help="take pictures when the image changes")
+    mul.add_argument("--max-pending", type=int, default=4, help="pictures per source waiting for a worker")
+    mul.add_argument("--duration", type=float, default=0, help="seconds to run (default: until Ctrl+C)")
+    mul.add_argument("--status", type=float, default=5, help="seconds between status lines")
+    for command in (bat, play, mul):
+        command.add_argument("--kernel", type=int, default=7, help="Gaussian kernel size")
+        command.add_argument("--std", type=int, default=1, help="Gaussian std deviation")
+        command.add_argument("--sigma", type=float, default=.33, help="sigma for automatic thresholds")
+        command.add_argument("--thresholds", type=int, nargs=2, metavar=("T1", "T2"),
+                             help="manual Canny thresholds")
+        command.add_argument("--no-blurred", dest="save_blurred", action="store_false",
+                             help="do not save blurred images")
+    bat.add_argument("--force", action="store_true", help="reprocess images whose output exists")
+    bat.add_argument("--progress", type=int, default=100, help="print progress every N images (0: never)")
+    return parser.parse_args(argv)
+
+def run(args):
+    app = QtGui.QApplication(sys.argv[:1])
+    GUI = Window(makeSource(args.source))
     sys.exit(app.exec_())
 
-run()
+def main(argv=None):
+    args = parseArguments(sys.argv[1:] if argv is None else argv)
+    if args.command == "batch":
+        sys.exit(batch(args))
+    if args.command == "play":
+        sys.exit(play(args))
+    if args.command == "multi":
+        sys.exit(multi(args))
+    run(args)
+
+if __name__ == "__main__":
+    main()
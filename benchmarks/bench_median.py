@@ -0,0 +1,58 @@
+"""Benchmark of the median used for automatic Canny thresholds.
+
+Compares the original np.median on the 3-channel re-read blurred image
+with the histogram median of 'CamView.imageMedian' at 720p, 1080p and 4K,
+and checks that the automatic thresholds are identical.
+
+Usage: python benchmarks/bench_median.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import CamView                                              # noqa: E402
+
+RESOLUTIONS = [("720p", 1280, 720), ("1080p", 1920, 1080), ("4K", 3840, 2160)]
+
+def thresholds(v, sigma=.33):                               # same formula as 'Capture.getThresholds'
+    return int(max(0, (1.0 - sigma) * v)), int(min(255, (1.0 + sigma) * v))
+
+def blurredFrame(width, height):
+    source = CamView.SyntheticSource(width, height, fps=0)
+    source.open()
+    ret, frame = source.read()
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    noise = np.random.RandomState(0).randint(0, 32, gray.shape).astype(np.uint8)
+    return cv2.GaussianBlur(cv2.add(gray, noise), (7, 7), 1)
+
+def best(function, repeat):                                 # best time of 'repeat' runs, in ms
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    print("{:<6} {:>14} {:>14} {:>14} {:>14} {:>14} {:>9}".format(
+        "", "np.median 3ch", "np.median 1ch", "histogram", "stride 4", "incremental", "speedup"))
+    for label, width, height in RESOLUTIONS:
+        blur = blurredFrame(width, height)
+        blur3 = cv2.cvtColor(blur, cv2.COLOR_GRAY2BGR)      # what cv2.imread returned before
+        assert thresholds(np.median(blur3)) == thresholds(CamView.imageMedian(blur))
+
+        incremental = CamView.IncrementalMedian(stride=4)
+        t_old = best(lambda: np.median(blur3), args.repeat)
+        t_one = best(lambda: np.median(blur), args.repeat)
+        t_hist = best(lambda: CamView.imageMedian(blur), args.repeat)
+        t_stride = best(lambda: CamView.imageMedian(blur, 4), args.repeat)
+        t_incr = best(lambda: incremental.update(blur), args.repeat)
+        print("{:<6} {:>11.2f} ms {:>11.2f} ms {:>11.2f} ms {:>11.2f} ms {:>11.2f} ms {:>8.1f}x".format(
+            label, t_old, t_one, t_hist, t_stride, t_incr, t_old / t_hist))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Benchmark of the edge detection pipeline of 'CamView.Capture'.
+
+Runs 'blurImage', 'getThresholds' and 'cannyEdges' without a camera or a
+display, on synthetic frames (or frames from --input) at 480p, 720p, 1080p
+and 4K, for every kernel size, with automatic and manual thresholds, and
+on two paths:
+
+    memory - frame passed in memory, blurred image not saved, background writer
+    disk   - frame and blurred image read back from disk, synchronous writes
+
+'findMatch' (the computation behind the 'Match' button) is measured against
+a library of --library captured images. Reports throughput, p50/p99 latency
+and peak memory (tracemalloc peak of one run, process max RSS). Results can
+be saved as a baseline and compared with a later run; the comparison exits
+with status 1 when a case is slower than the baseline by more than
+--tolerance percent.
+
+Usage: python benchmarks/bench_pipeline.py [--resolutions 480p 1080p] [--kernels 3 7]
+                                           [--repeat N] [--save FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+try:
+    import resource                                         # max RSS, not available on Windows
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import CamView                                              # noqa: E402
+
+RESOLUTIONS = [("480p", 640, 480), ("720p", 1280, 720), ("1080p", 1920, 1080), ("4K", 3840, 2160)]
+KERNELS = [1, 3, 5, 7, 9]                                   # same range as the 'Kernel Size' spinbox
+PATHS = ["memory", "disk"]
+THRESHOLDS = ["auto", "manual"]
+
+def noisy(frame, seed):                                     # sensor-like noise for Canny and ORB
+    noise = np.random.RandomState(seed).randint(0, 32, frame.shape).astype(np.uint8)
+    return cv2.add(frame, noise)
+
+def inputFrames(file_name, count):
+    """Frames of a video file, or the same image 'count' times."""
+    frames = []
+    source = CamView.VideoFileSource(file_name, loop=True, realtime=False)
+    if source.open():
+        while len(frames) < count:
+            ret, frame = source.read()
+            if not ret:
+                break
+            frames.append(frame)
+        source.release()
+    if not frames:
+        frame = cv2.imread(file_name)
+        if frame is None:
+            sys.exit("Cannot read {}".format(file_name))
+        frames = [frame] * count
+    return frames
+
+def makeFrames(args, width, height, count):
+    if args.input:
+        return [noisy(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA), i)
+                for i, frame in enumerate(inputFrames(args.input, count))]
+    source = CamView.SyntheticSource(width, height, fps=0)
+    source.open()
+    frames = []
+    for i in range(count):
+        ret, frame = source.read()
+        source.frame_number += 7                            # spread the circle positions
+        frames.append(noisy(frame, i))
+    return frames
+
+def maxRss():                                               # process peak resident memory, in MB
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024.0 / (1024.0 if sys.platform == "darwin" else 1.0)
+
+def summary(times, peak):
+    times = np.array(times) * 1000
+    return {"p50_ms": float(np.percentile(times, 50)), "p99_ms": float(np.percentile(times, 99)),
+            "fps": float(1000 / times.mean()), "peak_mb": peak / 1e6}
+
+def newCapture(root):
+    capture = CamView.Capture(root=root, headless=True)     # no camera, synchronous writer
+    capture.verbose = False
+    capture.show_canny_image = False
+    capture.img_index = capture.catalog.nextIndex()
+    return capture
+
+def setPath(capture, path):
+    capture.writer.close()
+    if path == "memory":
+        capture.writer = CamView.ImageWriter(2)             # background writer, as in the GUI
+        capture.save_blurred = False
+    else:
+        capture.writer = CamView.ImageWriter(0)             # write before returning
+        capture.save_blurred = True
+
+def runPipeline(capture, img_name, frame, path):
+    """One capture through blurImage, getThresholds and cannyEdges; returns the stage times."""
+    capture.blur_cache.clear()                              # every run blurs from scratch
+    capture.blur_entry = None
+    t0 = time.perf_counter()
+    if path == "memory":
+        blur_name, blur = capture.blurImage(img_name, frame)
+    else:
+        blur_name, blur = capture.blurImage(img_name)       # read the capture from disk
+        blur = None                                         # and the blurred image too
+    t1 = time.perf_counter()
+    capture.getThresholds(blur_name, blur)
+    t2 = time.perf_counter()
+    capture.cannyEdges(blur_name, blur)                     # computes the thresholds again
+    t3 = time.perf_counter()
+    return t1 - t0, t2 - t1, t3 - t2, t3 - t0
+
+def benchPipeline(capture, label, frames, args, results):
+    img_name = capture.img_dir.format(capture.img_index)
+    capture.writer.write(img_name, frames[0], "capture")    # for the disk path
+    for path in PATHS:
+        setPath(capture, path)
+        for kernel in args.kernels:
+            capture.kernelSize(kernel)
+            for thresholds in THRESHOLDS:
+                capture.manual_canny = thresholds == "manual"
+                for i in range(args.warmup):
+                    runPipeline(capture, img_name, frames[0], path)
+                capture.writer.flush()
+                stages = []
+                for i in range(args.repeat):
+                    stages.append(runPipeline(capture, img_name, frames[0], path))
+                    capture.writer.flush()                  # not timed: keeps the queue from filling
+                tracemalloc.start()
+                runPipeline(capture, img_name, frames[0], path)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                capture.writer.flush()
+                blur, thr, canny, total = [[s[n] for s in stages] for n in range(4)]
+                result = summary(total, peak)
+                for name, times in (("blur", blur), ("thresholds", thr), ("canny", canny)):
+                    result[name + "_p50_ms"] = float(np.percentile(times, 50) * 1000)
+                key = "{} k{} {} {}".format(label, kernel, thresholds, path)
+                results[key] = result
+                print("{:<26} {:>8.2f} {:>8.2f} {:>8.2f} {:>9.2f} {:>9.2f} {:>8.1f} {:>8.1f}".format(
+                    key, result["blur_p50_ms"], result["thresholds_p50_ms"], result["canny_p50_ms"],
+                    result["p50_ms"], result["p99_ms"], result["fps"], result["peak_mb"]))
+
+def benchMatch(capture, label, frames, args, results):
+    capture.writer.close()
+    capture.writer = CamView.ImageWriter(0)
+    capture.descriptor_index = CamView.DescriptorIndex(capture.descriptor_dir)
+    for i, frame in enumerate(frames[1:]):                  # library of captured images
+        file_name = capture.writer.write(capture.img_dir.format(1000 + i), frame, "capture")
+        capture.descriptor_index.add(os.path.basename(file_name), frame)
+    query = noisy(frames[1], 1000)                          # a new shot of a captured scene
+    capture.findMatch(query)                                # warm up
+    times = []
+    for i in range(args.repeat):
+        t = time.perf_counter()
+        capture.findMatch(query)
+        times.append(time.perf_counter() - t)
+    tracemalloc.start()
+    capture.findMatch(query)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    capture.descriptor_index.close()
+    key = "{} match".format(label)
+    results[key] = summary(times, peak)
+    print("{:<26} {:>8} {:>8} {:>8} {:>9.2f} {:>9.2f} {:>8.1f} {:>8.1f}".format(
+        key, "", "", "", results[key]["p50_ms"], results[key]["p99_ms"], results[key]["fps"],
+        results[key]["peak_mb"]))
+
+def compare(results, file_name, tolerance):
+    """Print the p50 change of every case in the baseline; returns the number of regressions."""
+    with open(file_name) as baseline_file:
+        baseline = json.load(baseline_file)
+    print("\nCompared with {} ({}):".format(file_name, baseline["meta"]["date"]))
+    regressions = 0
+    for key, result in results.items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+        change = (result["p50_ms"] / old["p50_ms"] - 1) * 100
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions += 1
+        print("{:<26} {:>9.2f} -> {:>9.2f} ms {:>+7.1f}%{}".format(key, old["p50_ms"], result["p50_ms"], change, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolutions", nargs="+", default=[r[0] for r in RESOLUTIONS],
+                        choices=[r[0] for r in RESOLUTIONS], help="resolutions to run (default: all)")
+    parser.add_argument("--kernels", nargs="+", type=int, default=KERNELS, help="Gaussian kernel sizes")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed runs per case")
+    parser.add_argument("--library", type=int, default=20, help="captured images to match against")
+    parser.add_argument("--input", help="image or video to use instead of synthetic frames")
+    parser.add_argument("--no-match", action="store_true", help="skip the image matching cases")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline (JSON)")
+    parser.add_argument("--compare", metavar="FILE", help="compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=10, help="allowed p50 slowdown in %% (default 10)")
+    args = parser.parse_args()
+
+    results = {}
+    print("{:<26} {:>8} {:>8} {:>8} {:>9} {:>9} {:>8} {:>8}".format(
+        "case", "blur", "thresh", "canny", "p50 ms", "p99 ms", "fps", "peak MB"))
+    root = tempfile.mkdtemp(prefix="camview-bench-")
+    try:
+        for label, width, height in RESOLUTIONS:
+            if label not in args.resolutions:
+                continue
+            frames = makeFrames(args, width, height, args.library + 1)
+            capture = newCapture(os.path.join(root, label))
+            try:
+                benchPipeline(capture, label, frames, args, results)
+                if not args.no_match:
+                    benchMatch(capture, label, frames, args, results)
+            finally:
+                capture.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    rss = maxRss()
+    if rss is not None:
+        print("\nmax RSS: {:.0f} MB".format(rss))
+
+    if args.save:
+        meta = {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                "opencv": cv2.__version__, "numpy": np.__version__, "machine": platform.machine(),
+                "processor": platform.processor(), "cpus": os.cpu_count(), "repeat": args.repeat,
+                "input": args.input or "synthetic", "max_rss_mb": rss}
+        with open(args.save, "w") as out:
+            json.dump({"meta": meta, "results": results}, out, indent=2, sort_keys=True)
+        print("Baseline saved to " + args.save)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print("{} case(s) slower than the baseline by more than {}%".format(regressions, args.tolerance))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
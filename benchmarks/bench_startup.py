@@ -0,0 +1,87 @@
+"""Cold-start benchmark: time from a new Python process to a usable CamView.
+
+Every run starts a fresh interpreter and measures importing CamView, creating
+the Capture the window creates (camera opening in the background) and, with
+--window, creating and showing the Window. It also checks that matplotlib
+and PIL are not imported at startup. Exits with status 1 when the median
+total time is over --budget ms or a deferred module was imported, so it can
+guard kiosk start times.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--budget MS] [--device 0] [--window]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFERRED = ["matplotlib", "matplotlib.pyplot", "PIL", "PIL.Image"]    # must not load at startup
+
+# Runs in the new process; prints the phase times (ms) as JSON on the last line
+CHILD = """
+import json, os, sys, tempfile, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import CamView
+imported = time.perf_counter()
+device = {device!r}
+source = CamView.SyntheticSource() if device == "synthetic" else CamView.CameraSource(int(device) if device.isdigit() else device)
+times = {{"import": (imported - start) * 1000}}
+if {window!r}:
+    app = CamView.QtGui.QApplication(sys.argv)
+    window = CamView.Window(source, tempfile.mkdtemp())
+    app.processEvents()
+    capture = window.capture
+    times["window"] = (time.perf_counter() - imported) * 1000
+else:
+    capture = CamView.Capture(source, root=tempfile.mkdtemp())
+    times["capture"] = (time.perf_counter() - imported) * 1000
+times["total"] = (time.perf_counter() - start) * 1000
+capture.grabber.waitForFrame(timeout=10)
+times["first_frame"] = (time.perf_counter() - start) * 1000
+times["state"] = capture.connectionState()
+times["deferred_loaded"] = [name for name in {deferred!r} if name in sys.modules]
+capture.close()
+print(json.dumps(times))
+os._exit(0)                                                 # skip Qt teardown
+"""
+
+def runOnce(args):
+    code = CHILD.format(root=ROOT, device=args.device, window=args.window, deferred=DEFERRED)
+    output = subprocess.check_output([sys.executable, "-c", code], universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to start (median is kept)")
+    parser.add_argument("--budget", type=float, default=1500, help="allowed median startup time in ms")
+    parser.add_argument("--device", default="synthetic", help="camera index, video file or 'synthetic'")
+    parser.add_argument("--window", action="store_true", help="create and show the Window (needs a display)")
+    args = parser.parse_args()
+
+    runs = [runOnce(args) for i in range(args.runs)]
+    phases = ["import", "window" if args.window else "capture", "total", "first_frame"]
+    print("{:<12} {:>10} {:>10} {:>10}".format("phase (ms)", "median", "min", "max"))
+    for phase in phases:
+        values = [run[phase] for run in runs]
+        print("{:<12} {:>10.1f} {:>10.1f} {:>10.1f}".format(phase, np.median(values), min(values), max(values)))
+    print("camera: {}".format(runs[-1]["state"]))
+
+    failed = False
+    total = np.median([run["total"] for run in runs])
+    if total > args.budget:
+        print("FAIL: startup took {:.0f} ms, budget is {:.0f} ms".format(total, args.budget))
+        failed = True
+    loaded = sorted(set(name for run in runs for name in run["deferred_loaded"]))
+    if loaded:
+        print("FAIL: imported at startup: {}".format(", ".join(loaded)))
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK: startup {:.0f} ms within {:.0f} ms".format(total, args.budget))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # CamView.py
+import CamView                                              # noqa: E402
+
+@pytest.fixture
+def capture(tmp_path):
+    """Capture of a small synthetic source under a temporary root, with a first frame grabbed."""
+    capture = CamView.Capture(CamView.SyntheticSource(64, 48, fps=0), str(tmp_path / "CamView"))
+    capture.verbose = False
+    capture.show_canny_image = False
+    capture.grabber.waitForFrame(timeout=5)
+    yield capture
+    capture.close()
@@ -0,0 +1,33 @@
+"""Tests of the headless batch command."""
+import cv2
+
+import CamView
+
+def runBatch(input_dir, root, capsys):
+    args = CamView.parseArguments(["batch", str(input_dir), "--root", str(root), "--workers", "2"])
+    status = CamView.batch(args)
+    return status, capsys.readouterr().out
+
+def test_batch_skips_processed_images(tmp_path, capsys):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    source = CamView.SyntheticSource(64, 48, fps=0)
+    source.open()
+    for i in range(1, 5):
+        cv2.imwrite(str(input_dir / "img_{}.png".format(i)), source.read()[1])
+    root = tmp_path / "CamView"
+
+    status, out = runBatch(input_dir, root, capsys)
+    assert status == 0
+    assert "Processed 4 images, skipped 0, failed 0" in out
+    outputs = sorted((root / "3-processed").iterdir())
+    assert len(outputs) == 4
+
+    status, out = runBatch(input_dir, root, capsys)
+    assert status == 0
+    assert "Processed 0 images, skipped 4, failed 0" in out
+
+    outputs[0].unlink()                                     # resume: only the missing output is made
+    status, out = runBatch(input_dir, root, capsys)
+    assert "Processed 1 images, skipped 3, failed 0" in out
+    assert len(list((root / "3-processed").iterdir())) == 4
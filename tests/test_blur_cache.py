@@ -0,0 +1,47 @@
+"""Tests of the cache of grayscale and blurred images."""
+import cv2
+import numpy as np
+
+import CamView
+
+def test_blur_cache_evicts_least_recently_used():
+    cache = CamView.BlurCache(max_bytes=25)
+    cache.put(("a",), "A", 10)
+    cache.put(("b",), "B", 10)
+    assert cache.get(("a",)) == "A"                         # 'b' is now the oldest
+    cache.put(("c",), "C", 10)
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == "A"
+    assert cache.get(("c",)) == "C"
+    assert cache.stats() == {"hits": 3, "misses": 1, "entries": 2, "bytes": 20}
+
+def test_blur_cache_skips_oversized_and_invalidates():
+    cache = CamView.BlurCache(max_bytes=25)
+    cache.put(("a",), "A", 10)
+    cache.put(("a", (3, 3), 1), "blur", 10)
+    cache.put(("big",), "BIG", 30)                          # larger than the whole cache
+    assert cache.get(("big",)) is None
+    assert cache.get(("a",)) == "A"
+    cache.invalidate("a")
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+def test_reference_blur_does_not_keep_capture_blur_name(capture):
+    capture.takePicture()
+    capture.detectEdges()
+    blur_name = capture.blur_entry.file_name
+    capture.backgroundReference()                           # same blur_N name as img_N
+    capture.detectEdges()                                   # cached blur of img_N
+    capture.writer.flush()
+    assert capture.blur_entry.file_name == blur_name
+    assert np.array_equal(cv2.imread(blur_name, cv2.IMREAD_GRAYSCALE), capture.blur_entry.blur)
+    row, = capture.catalog.outputs(kind="blur", path=blur_name)
+    assert row["source"].endswith("img_1.png")
+
+def test_blur_cache_hits_for_repeated_detection(capture):
+    capture.takePicture()
+    capture.detectEdges()
+    misses = capture.blur_cache.stats()["misses"]
+    capture.detectEdges()
+    assert capture.blur_cache.stats()["misses"] == misses
+    assert capture.blur_cache.stats()["hits"] >= 1
@@ -0,0 +1,48 @@
+"""Tests of the capture catalog."""
+import multiprocessing
+
+import pytest
+
+import CamView
+
+def takeIndices(args):
+    file_name, count = args
+    catalog = CamView.Catalog(file_name)
+    return [catalog.nextIndex() for i in range(count)]
+
+def test_catalog_indices_unique_across_processes(tmp_path):
+    file_name = str(tmp_path / "catalog.db")
+    CamView.Catalog(file_name)
+    pool = multiprocessing.get_context("spawn").Pool(4)        # separate processes, like several CamViews
+    try:
+        results = pool.map(takeIndices, [(file_name, 25)] * 8)
+    finally:
+        pool.close()
+        pool.join()
+    indices = [index for result in results for index in result]
+    assert sorted(indices) == list(range(1, 201))
+    assert CamView.Catalog(file_name).currentIndex() == 200
+
+def test_sweep_filed_under_requested_image(capture):
+    capture.takePicture()
+    thread = capture.sweepParameters("aperture")
+    capture.takePicture()                                   # while the sweep runs
+    thread.join(60)
+    rows = capture.catalog.outputs(kind="sweep")
+    assert len(rows) == 3
+    assert all(row["img_index"] == 1 and row["source"].endswith("img_1.png") for row in rows)
+
+class BrokenDevice():
+    def __str__(self):
+        raise IOError("device gone")
+
+def test_failed_capture_record_is_rolled_back(tmp_path):
+    catalog = CamView.Catalog(str(tmp_path / "catalog.db"))
+    catalog.addOutput("blur_1.png", 1, "img_1.png", "blur", (7, 7), 1)
+    with pytest.raises(IOError):
+        catalog.addCapture("img_1.png", 1, device=BrokenDevice())
+    assert not catalog.connection().in_transaction
+    assert len(catalog.outputs(source="img_1.png")) == 1    # delete undone
+    catalog.addCapture("img_1.png", 1, device=0)
+    assert catalog.captures(1)[0]["device"] == "0"
+    assert not catalog.outputs(source="img_1.png")
@@ -0,0 +1,88 @@
+"""Tests of the ORB descriptor index behind the 'Match' button."""
+import cv2
+import numpy as np
+
+import CamView
+
+def test_library_skips_partial_writes(capture):
+    capture.takePicture()
+    capture.writer.flush()
+    a_dir = capture.root + "/1-captured"
+    frame = capture.last_picture[1]
+    with open(a_dir + "/img_2.png.part", "wb") as part:     # capture still being written
+        part.write(cv2.imencode(".png", frame)[1].tobytes())
+    capture.indexLibrary()
+    capture.descriptor_index.flush()
+    assert "img_2.png.part" not in capture.descriptor_index.ids
+    assert "img_1.png" in capture.descriptor_index.ids
+
+def scene(seed):                                            # distinct textured image
+    noise = np.random.RandomState(seed).randint(0, 256, (120, 160)).astype(np.uint8)
+    return cv2.cvtColor(cv2.resize(noise, (320, 240), interpolation=cv2.INTER_NEAREST), cv2.COLOR_GRAY2BGR)
+
+def shot(seed):                                             # a new shot of scene 'seed'
+    noise = np.random.RandomState(1000 + seed).randint(0, 8, (240, 320, 3)).astype(np.uint8)
+    return cv2.add(scene(seed), noise)
+
+def best(index, img):
+    ranking = index.query(img)
+    return ranking[0][0] if ranking else None
+
+def test_index_merges_recent_images(tmp_path):
+    index = CamView.DescriptorIndex(str(tmp_path / ".descriptors"))
+    index.MERGE_SIZE = 4
+    try:
+        for i in range(10):
+            index.add("img_{}.png".format(i), scene(i))
+        index.flush()                                       # background rebuilds
+        assert index.matcher is not None
+        assert len(index.recent) < 4
+        for i in (0, 5, 9):
+            assert best(index, shot(i)) == "img_{}.png".format(i)
+    finally:
+        index.close()
+
+def test_index_replaced_image(tmp_path):
+    index = CamView.DescriptorIndex(str(tmp_path / ".descriptors"))
+    try:
+        for i in range(5):
+            index.add("img_{}.png".format(i), scene(i))
+        index.merge()                                       # img_2 is in the LSH index
+        index.add("img_2.png", scene(9))                    # and replaced after it was built
+        assert best(index, shot(9)) == "img_2.png"
+        assert best(index, shot(2)) != "img_2.png"
+        index.merge()
+        assert not index.recent
+        assert best(index, shot(9)) == "img_2.png"
+    finally:
+        index.close()
+
+def test_index_reloaded_from_store(tmp_path):
+    file_name = str(tmp_path / ".descriptors")
+    index = CamView.DescriptorIndex(file_name)
+    for i in range(3):
+        index.add("img_{}.png".format(i), scene(i))
+    index.add("img_1.png", scene(7))                        # later record replaces the first
+    index.close()
+    with open(file_name, "ab") as store:
+        store.write(b"\x05\x00")                            # record cut short by a crash
+    index = CamView.DescriptorIndex(file_name)
+    try:
+        index.flush()
+        assert index.names == ["img_0.png", "img_1.png", "img_2.png"]
+        assert not index.recent
+        assert best(index, shot(7)) == "img_1.png"
+    finally:
+        index.close()
+
+def test_capture_indexes_earlier_captures_at_startup(tmp_path):
+    a_dir = tmp_path / "CamView" / "1-captured"
+    a_dir.mkdir(parents=True)
+    for i in range(1, 4):
+        cv2.imwrite(str(a_dir / "img_{}.png".format(i)), scene(i))
+    capture = CamView.Capture(CamView.SyntheticSource(64, 48, fps=0), str(tmp_path / "CamView"))
+    try:
+        assert capture.library_indexing.result(timeout=30) == 3
+        assert best(capture.descriptor_index, shot(2)) == "img_2.png"
+    finally:
+        capture.close()
@@ -0,0 +1,43 @@
+"""Tests of the background frame grabber."""
+import CamView
+
+class FailingSource(CamView.SyntheticSource):
+    def open(self):
+        return False
+
+def startGrabber(buffer_size=4):
+    grabber = CamView.FrameGrabber(CamView.SyntheticSource(64, 48, fps=0), buffer_size=buffer_size)
+    grabber.start()
+    return grabber
+
+def test_grabber_ring_buffer_keeps_newest_frames():
+    grabber = startGrabber(buffer_size=3)
+    try:
+        number, timestamp, frame = grabber.waitForFrame(after=10, timeout=5)
+        assert number > 10
+        assert frame.shape == (48, 64, 3)
+    finally:
+        grabber.stop()
+    numbers = [n for n, t, f in grabber.frames]
+    assert len(numbers) == 3
+    assert numbers == list(range(numbers[0], numbers[0] + 3))  # consecutive, oldest dropped
+    assert numbers[-1] == grabber.frame_count
+    assert grabber.latestFrame()[0] == grabber.frame_count
+
+def test_grabber_latest_frame_is_a_copy():
+    grabber = startGrabber()
+    try:
+        grabber.waitForFrame(timeout=5)
+    finally:
+        grabber.stop()
+    number, timestamp, frame = grabber.latestFrame()
+    frame[:] = 0
+    assert grabber.latestFrame(copy=False)[2].any()
+
+def test_grabber_failed_source():
+    grabber = CamView.FrameGrabber(FailingSource())
+    grabber.start()
+    assert grabber.waitForFrame(timeout=5) == (0, None, None)
+    assert grabber.state == "failed"
+    grabber.join(5)
+    assert not grabber.is_alive()
@@ -0,0 +1,49 @@
+"""Tests of live edge detection on the grabbed frames."""
+import time
+
+import CamView
+
+class FailingSource(CamView.SyntheticSource):
+    def open(self):
+        return False
+
+def waitFor(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_preview_drops_frames_to_keep_up(capture):
+    preview = CamView.LivePreview(capture.grabber, capture, target_fps=10, scale=0.5)
+    preview.start()
+    try:
+        assert waitFor(lambda: preview.latestResult() is not None and preview.dropped > 0)
+        number, edges, fps, latency = preview.latestResult()
+        assert edges.shape == (24, 32)                      # processed at half size
+        assert number <= capture.grabber.frame_count
+    finally:
+        preview.stop()
+    assert not preview.is_alive()
+    assert "live canny" in capture.stats.snapshot()["stages"]
+
+def test_preview_survives_failing_frames(capture, capsys):
+    capture.kernel_size = (4, 4)                            # rejected by GaussianBlur
+    preview = CamView.LivePreview(capture.grabber, capture, target_fps=0)
+    preview.start()
+    try:
+        assert waitFor(lambda: preview.errors >= 2)
+        assert preview.is_alive() and preview.latestResult() is None
+        capture.kernelSize(4)                               # made odd
+        assert capture.kernel_size == (5, 5)
+        assert waitFor(lambda: preview.latestResult() is not None)
+    finally:
+        preview.stop()
+    assert capsys.readouterr().out.count("WARNING: Live edge detection failed") == 1
+
+def test_preview_stops_when_camera_fails(capture):
+    grabber = CamView.FrameGrabber(FailingSource())
+    grabber.start()
+    preview = CamView.LivePreview(grabber, capture)
+    preview.start()
+    preview.join(5)
+    assert not preview.is_alive()
@@ -0,0 +1,32 @@
+"""Tests of the histogram median behind automatic Canny thresholds."""
+import numpy as np
+import pytest
+
+import CamView
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 5), (4, 6), (48, 64), (101, 33)])
+def test_image_median_equals_numpy(shape):
+    img = np.random.RandomState(sum(shape)).randint(0, 256, shape).astype(np.uint8)
+    assert CamView.imageMedian(img) == np.median(img)
+
+def test_image_median_even_count_is_mean_of_middle_pair():
+    img = np.array([[10] * 6 + [21] * 6], np.uint8)
+    assert CamView.imageMedian(img) == np.median(img) == 15.5
+
+def test_image_median_with_stride_counts_subsampled_pixels():
+    img = np.random.RandomState(3).randint(0, 256, (40, 60)).astype(np.uint8)
+    assert CamView.imageMedian(img, stride=4) == np.median(img[::4, ::4])
+
+def test_large_image_median_uses_exact_counts():
+    img = np.zeros((4097, 4097), np.uint8)                  # over 2 ** 24 pixels
+    img[:2049] = 200
+    assert CamView.imageMedian(img) == np.median(img) == 200
+
+def test_incremental_median_covers_every_pixel_per_window():
+    img = np.random.RandomState(5).randint(0, 256, (32, 32)).astype(np.uint8)
+    median = CamView.IncrementalMedian(stride=2)
+    for i in range(4):                                      # one window: every grid offset once
+        v = median.update(img)
+    assert v == np.median(img)
+    median.reset()
+    assert median.update(np.full((32, 32), 7, np.uint8)) == 7
@@ -0,0 +1,54 @@
+"""Tests of the motion trigger."""
+import time
+
+import CamView
+
+def frames():
+    source = CamView.SyntheticSource(64, 48, fps=0)
+    source.open()
+    return source.background.copy(), source.read()[1]       # empty scene, scene with the circle
+
+def test_reference_mode_compares_with_fixed_frame():
+    empty, moved = frames()
+    trigger = CamView.MotionTrigger(None, None, reference=empty, width=32)
+    assert trigger.changedFraction(trigger.downscale(empty)) == 0
+    changed = trigger.changedFraction(trigger.downscale(moved))
+    assert changed > 0.02
+    assert trigger.changedFraction(trigger.downscale(moved)) == changed    # the reference never learns
+
+def test_running_average_learns_the_scene():
+    empty, moved = frames()
+    trigger = CamView.MotionTrigger(None, None, width=32, learning_rate=0.5)
+    assert trigger.changedFraction(trigger.downscale(empty)) == 0           # first frame is the model
+    fractions = [trigger.changedFraction(trigger.downscale(moved)) for i in range(10)]
+    assert fractions[0] > 0.02
+    assert fractions[-1] == 0                               # the circle became background
+    trigger.setReference(empty)                             # switch to a fixed reference
+    assert trigger.changedFraction(trigger.downscale(moved)) == fractions[0]
+
+def runTrigger(cooldown, seconds=0.6, action=None):
+    empty, moved = frames()
+    grabber = CamView.FrameGrabber(CamView.SyntheticSource(64, 48, fps=0))
+    grabber.start()
+    calls = []
+    trigger = CamView.MotionTrigger(grabber, action or calls.append, reference=empty, width=32,
+                                    cooldown=cooldown, target_fps=50)
+    trigger.start()
+    time.sleep(seconds)
+    trigger.stop()
+    grabber.stop()
+    return trigger, calls
+
+def test_cooldown_limits_triggers():
+    trigger, calls = runTrigger(cooldown=10)
+    assert len(calls) == 1 and trigger.triggers == 1
+    assert calls[0] >= trigger.trigger_fraction
+    trigger, calls = runTrigger(cooldown=0)
+    assert len(calls) > 5                                   # every compared frame
+
+def test_failing_action_keeps_trigger_running(capsys):
+    def action(fraction):
+        raise IOError("disk full")
+    trigger, calls = runTrigger(cooldown=0.1, action=action)
+    assert trigger.triggers > 1
+    assert "WARNING: Motion trigger action failed: disk full" in capsys.readouterr().out
@@ -0,0 +1,72 @@
+"""Tests of burst and spool recording and of processing recordings."""
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import CamView
+
+def spoolFrames(count):
+    return [np.full((6, 8, 3), i, np.uint8) for i in range(count)]
+
+def test_frame_spool_round_trip(tmp_path):
+    file_name = str(tmp_path / "rec.raw")
+    spool = CamView.FrameSpool(file_name, fps=30)
+    for i, frame in enumerate(spoolFrames(5)):
+        spool.write(frame, timestamp=float(i))
+    spool.close()
+    frames = CamView.FrameSpool.load(file_name)
+    assert frames.shape == (5, 6, 8, 3)
+    assert np.array_equal(np.asarray(frames), np.array(spoolFrames(5)))
+    source = CamView.SpoolSource(file_name)
+    assert source.open()
+    assert sum(1 for i in range(10) if source.read()[0]) == 5
+
+def test_frame_spool_truncated(tmp_path):
+    file_name = str(tmp_path / "rec.raw")
+    spool = CamView.FrameSpool(file_name)
+    for frame in spoolFrames(4):
+        spool.write(frame)
+    spool.spool.flush()                                     # crash: never closed
+    with open(file_name, "r+b") as raw:
+        raw.truncate(os.path.getsize(file_name) - 10)       # last frame cut short
+    frames = CamView.FrameSpool.load(file_name)
+    assert len(frames) == 3
+    assert np.array_equal(np.asarray(frames), np.array(spoolFrames(3)))
+
+def test_frame_spool_rejects_shape_change(tmp_path):
+    spool = CamView.FrameSpool(str(tmp_path / "rec.raw"))
+    spool.write(np.zeros((6, 8), np.uint8))
+    with pytest.raises(ValueError):
+        spool.write(np.zeros((8, 6), np.uint8))
+    spool.close()
+
+def test_burst_recorder_copies_consecutive_frames():
+    grabber = CamView.FrameGrabber(CamView.SyntheticSource(64, 48, fps=0))
+    grabber.start()
+    try:
+        recorder = CamView.BurstRecorder(grabber, count=5)
+        recorder.start()
+        assert recorder.wait(5)
+    finally:
+        grabber.stop()
+    frames = recorder.frames()
+    assert frames.shape == (5, 48, 64, 3)
+    assert np.all(np.diff(recorder.timestamps) >= 0)
+    assert not np.array_equal(frames[0], frames[4])         # the circle moved
+
+def test_process_recording_of_burst_folder_and_spool(capture):
+    burst = os.path.join(capture.root, "5-recorded", "burst_1")
+    os.makedirs(burst)
+    for i, frame in enumerate(spoolFrames(3)):
+        cv2.imwrite(os.path.join(burst, "frame_{:04d}.png".format(i)), frame)
+    spool = CamView.FrameSpool(os.path.join(capture.root, "5-recorded", "rec_2.raw"))
+    for frame in spoolFrames(4):
+        spool.write(frame)
+    spool.close()
+    assert capture.processRecording(burst) == 3
+    assert capture.processRecording(spool.file_name) == 4
+    outputs = os.listdir(os.path.join(capture.root, "3-processed"))
+    assert len([name for name in outputs if name.startswith("canny_burst_1_")]) == 3
+    assert len([name for name in outputs if name.startswith("canny_rec_2_")]) == 4
@@ -0,0 +1,44 @@
+"""Tests of capturing from several sources with one process pool."""
+import os
+
+import CamView
+
+def makeStation(tmp_path, count=2, max_pending=4):
+    sources = [CamView.SyntheticSource(64, 48, fps=0) for i in range(count)]
+    station = CamView.CameraStation(sources, str(tmp_path), {"save_blurred": False}, processes=1,
+                                    max_pending=max_pending)
+    for capture in station.captures:
+        capture.grabber.waitForFrame(timeout=5)
+    return station
+
+def counters(capture):
+    return capture.stats.snapshot()["counters"]
+
+def test_station_drops_pictures_over_backlog(tmp_path):
+    station = makeStation(tmp_path, count=1, max_pending=1)
+    try:
+        for i in range(5):                                  # faster than the pool
+            station.takePicture(0)
+    finally:
+        station.close()
+    capture = station.captures[0]
+    taken, dropped = counters(capture).get("pictures", 0), counters(capture).get("pictures dropped", 0)
+    assert taken >= 1 and dropped >= 1
+    assert taken + dropped == 5
+    assert station.pending == [0]
+    assert counters(capture).get("edges done") == taken
+    assert len(os.listdir(os.path.join(capture.root, "3-processed"))) == taken
+
+def test_station_sources_have_own_directories(tmp_path):
+    station = makeStation(tmp_path)
+    try:
+        for number in range(2):
+            station.takePicture(number)
+    finally:
+        station.close()
+    for number, capture in enumerate(station.captures):
+        assert capture.root == os.path.join(str(tmp_path), "cam{}".format(number))
+        assert counters(capture)["edges done"] == 1
+        assert capture.descriptor_index is None             # pictures are not indexed for matching
+        assert not os.path.exists(capture.descriptor_dir)
+    assert "cam1" in station.report()
@@ -0,0 +1,68 @@
+"""Tests of the per-stage timing statistics."""
+import json
+
+import pytest
+
+import CamView
+
+def test_percentiles_within_bucket_resolution():
+    stats = CamView.Stats(enabled=True)
+    for ms in range(1, 101):                                # 1 to 100 ms
+        stats.record("blur", ms / 1000.0)
+    stage = stats.snapshot()["stages"]["blur"]
+    assert stage["count"] == 100
+    assert stage["mean_ms"] == pytest.approx(50.5)
+    assert stage["min_ms"] == pytest.approx(1) and stage["max_ms"] == pytest.approx(100)
+    for p, exact in ((50, 50), (90, 90), (99, 99)):
+        assert exact <= stage["p{}_ms".format(p)] <= exact * 1.1
+    assert sum(stage["buckets"].values()) == 100
+
+def test_regression_changes_p50():
+    before, after = CamView.Stats(enabled=True), CamView.Stats(enabled=True)
+    for i in range(45):
+        before.record("canny", 0.033)
+        after.record("canny", 0.040)                        # 20% slower
+    for i in range(5):                                      # same slow tail
+        before.record("canny", 0.045)
+        after.record("canny", 0.045)
+    assert after.snapshot()["stages"]["canny"]["p50_ms"] > before.snapshot()["stages"]["canny"]["p50_ms"]
+
+def test_disabled_stats_record_nothing():
+    stats = CamView.Stats()
+    assert stats.stage("blur") is CamView.NULL_TIMER
+    with stats.stage("blur"):
+        pass
+    stats.record("blur", 0.01)
+    stats.count("pictures")
+    snap = stats.snapshot()
+    assert not snap["stages"] and not snap["counters"]
+
+def test_stage_timer_counters_gauges_and_export(tmp_path):
+    stats = CamView.Stats(enabled=True)
+    with stats.stage("encode"):
+        pass
+    stats.count("pictures", 2)
+    stats.gauge("queue", lambda: 3)
+    stats.gauge("closed", lambda: 1 / 0)                    # component gone: reported as None
+    snap = stats.snapshot()
+    assert snap["stages"]["encode"]["count"] == 1
+    assert snap["counters"] == {"pictures": 2}
+    assert snap["gauges"] == {"queue": 3, "closed": None}
+    assert "encode" in stats.report()
+    stats.exportJson(str(tmp_path / "stats.json"))
+    with open(str(tmp_path / "stats.json")) as exported:
+        assert json.load(exported)["counters"] == {"pictures": 2}
+    stats.reset()
+    assert not stats.snapshot()["stages"]
+
+def test_grabber_records_frame_interval():
+    stats = CamView.Stats(enabled=True)
+    grabber = CamView.FrameGrabber(CamView.SyntheticSource(64, 48, fps=100), stats=stats)
+    grabber.start()
+    try:
+        grabber.waitForFrame(after=10, timeout=5)
+    finally:
+        grabber.stop()
+    stages = stats.snapshot()["stages"]
+    assert "grab" not in stages
+    assert stages["frame interval"]["mean_ms"] == pytest.approx(10, rel=0.5)  # the frame period
@@ -0,0 +1,42 @@
+"""Tests of the parallel parameter sweep."""
+import os
+
+import cv2
+import numpy as np
+
+import CamView
+
+def image():
+    source = CamView.SyntheticSource(64, 48, fps=0)
+    source.open()
+    return source.read()[1]
+
+def test_sweep_numbers_rows_and_skips_swapped_thresholds(tmp_path):
+    sweep = CamView.ParameterSweep(kernel_sizes=(3, 5), std_deviations=(1,), thresholds_1=(50, 150),
+                                   thresholds_2=(100,), apertures=(3, 5), processes=2)
+    assert sweep.size() == 4                                # 150:100 pairs are skipped
+    rows = sweep.run(image(), str(tmp_path))
+    assert [row[0] for row in rows] == [1, 2, 3, 4]
+    assert [(row[1], row[4], row[5], row[6]) for row in rows] == [
+        ((3, 3), 50, 100, 3), ((3, 3), 50, 100, 5), ((5, 5), 50, 100, 3), ((5, 5), 50, 100, 5)]
+    assert [os.path.basename(row[7]) for row in rows] == ["sweep_{:04d}.png".format(n) for n in range(1, 5)]
+    with open(str(tmp_path / "index.csv")) as index_file:
+        assert len(index_file.read().splitlines()) == 5     # header and one line per row
+
+def test_sweep_automatic_thresholds_and_contact_sheet(tmp_path):
+    sweep = CamView.ParameterSweep(kernel_sizes=(3,), std_deviations=(1, 2, 3), processes=4)
+    rows = sweep.run(image(), str(tmp_path), save_files=False)
+    assert len(rows) == 3
+    assert all(row[3] == sweep.sigma and row[4] <= row[5] and row[7] is None for row in rows)
+    sheet = cv2.imread(str(tmp_path / "contact.png"), cv2.IMREAD_GRAYSCALE)
+    assert sheet.shape[1] == 2 * sweep.thumb_width          # 3 tiles on a 2 x 2 grid
+    assert sorted(os.listdir(str(tmp_path))) == ["contact.png"]
+
+def test_sweep_uses_encoding(tmp_path):
+    sweep = CamView.ParameterSweep(processes=1)
+    sweep.encoding = CamView.Encoding("raw")
+    rows = sweep.run(image(), str(tmp_path), contact_sheet=False)
+    assert rows[0][7].endswith("sweep_0001.npy")
+    edges = np.load(rows[0][7])
+    assert edges.shape == (48, 64) and set(np.unique(edges)) <= {0, 255}
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".part")]
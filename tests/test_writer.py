@@ -0,0 +1,72 @@
+"""Tests of the background image writer and output encodings."""
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+import CamView
+
+class BlockedEncoding(CamView.Encoding):                    # writes once 'released' is set
+    def __init__(self):
+        super(BlockedEncoding, self).__init__()
+        self.released = threading.Event()
+
+    def write(self, file_name, img, stats=CamView.NO_STATS):
+        self.released.wait(10)
+        super(BlockedEncoding, self).write(file_name, img, stats)
+
+def image(channels=3):
+    img = np.random.RandomState(channels).randint(0, 256, (24, 32, channels)).astype(np.uint8)
+    return img[:, :, 0] if channels == 1 else img
+
+@pytest.mark.parametrize("fmt", ["png", "webp", "tiff", "raw"])
+@pytest.mark.parametrize("channels", [1, 3])
+def test_encodings_round_trip_losslessly(tmp_path, fmt, channels):
+    writer = CamView.ImageWriter(2)
+    writer.encodings["canny"] = CamView.Encoding(fmt, level=9)
+    try:
+        file_name = writer.write(str(tmp_path / "out.png"), image(channels), "canny")
+        assert file_name.endswith(CamView.Encoding.EXTENSIONS[fmt])
+        flags = cv2.IMREAD_COLOR if channels == 3 else cv2.IMREAD_GRAYSCALE
+        assert np.array_equal(writer.read(str(tmp_path / "out.png"), "canny", flags), image(channels))
+    finally:
+        writer.close()
+    assert os.listdir(str(tmp_path)) == [os.path.basename(file_name)]    # no '.part' left
+
+def test_unknown_format_rejected():
+    with pytest.raises(ValueError):
+        CamView.Encoding("gif")
+
+def test_full_queue_blocks_write(tmp_path):
+    writer = CamView.ImageWriter(1, max_pending=2)
+    encoding = writer.encodings["capture"] = BlockedEncoding()
+    for i in range(3):                                      # one being written, two queued
+        writer.write(str(tmp_path / "img_{}.png".format(i)), image(), "capture")
+    blocked = threading.Thread(target=writer.write, args=(str(tmp_path / "img_3.png"), image(), "capture"))
+    blocked.start()
+    blocked.join(0.3)
+    assert blocked.is_alive()                               # waits for room in the queue
+    assert writer.pending() == 4
+    encoding.released.set()
+    blocked.join(5)
+    writer.close()
+    assert writer.pending() == 0
+    assert sorted(os.listdir(str(tmp_path))) == ["img_{}.png".format(i) for i in range(4)]
+
+def test_failed_write_counted(tmp_path, capsys):
+    writer = CamView.ImageWriter(1)
+    writer.write(str(tmp_path / "missing" / "img.png"), image())
+    writer.close()
+    assert writer.errors == 1
+    assert "WARNING: Could not write" in capsys.readouterr().out
+
+def test_capture_close_writes_pending_images(capture):
+    encoding = capture.writer.encodings["capture"] = BlockedEncoding()
+    capture.takePicture()
+    file_name = capture.writer.fileName(capture.img_dir.format(capture.img_index), "capture")
+    assert not os.path.exists(file_name)
+    encoding.released.set()
+    capture.close()
+    assert os.path.exists(file_name)